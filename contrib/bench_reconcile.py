@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the record lookups a zone reconcile makes, run from the repository root:
+
+    DJANGO_SETTINGS_MODULE=django_project.settings.test python contrib/bench_reconcile.py
+"""
+import argparse
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+from unittest import mock
+
+
+def aws_records(count, root):
+    records = [{
+        'Name': root,
+        'Type': 'NS',
+        'TTL': 172800,
+        'ResourceRecords': [{'Value': 'ns-1.awsdns-1.com.'}],
+    }]
+    for i in range(count):
+        records.append({
+            'Name': 'www{}.{}'.format(i, root),
+            'Type': 'A',
+            'TTL': 300,
+            'ResourceRecords': [{'Value': '10.0.{}.{}'.format(i // 256 % 256, i % 256)}],
+        })
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the record lookups of a zone reconcile.')
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--policy-records', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_project.settings.test')
+    import django
+    django.setup()
+
+    from zinc import models
+    from zinc.route53 import record as record_module, Zone
+
+    db_zone = models.Zone(root='example.com.', route53_id='Z0BENCHMARK')
+    zone = Zone(db_zone)
+    zone._aws_records = aws_records(args.records, db_zone.root)
+    zone._exists = True
+    record_ids = [record_module.Record.from_aws_record(aws_record, zone=zone).id
+                  for aws_record in zone._aws_records[1:args.policy_records + 1]]
+
+    def reconcile():
+        # what a reconcile of a zone with a few dirty policy records looks up in the record set
+        for record_id in record_ids:
+            zone.get_record(record_id)
+            zone.records_with_prefix('_zn_')
+        zone.ns
+        for record in zone.iter_records():
+            record.is_hidden
+
+    decoded = []
+    from_aws_record = record_module.Record.from_aws_record.__func__
+
+    def counting_from_aws_record(cls, *args, **kwargs):
+        decoded.append(1)
+        return from_aws_record(cls, *args, **kwargs)
+
+    record_index = Zone._record_index
+
+    def decode_every_time(self):
+        # what we did before the index was shared: every lookup decodes the whole record set
+        self._records_index = None
+        return record_index(self)
+
+    def timed(count_label):
+        del decoded[:]
+        with mock.patch.object(record_module.Record, 'from_aws_record',
+                               classmethod(counting_from_aws_record)):
+            reconcile()
+        count = len(decoded)
+        elapsed = min(timeit.repeat(reconcile, number=1, repeat=args.repeat,
+                                    timer=time.process_time))
+        print('{}: {:8.2f} ms cpu, {:6} records decoded'.format(
+            count_label, elapsed * 1000, count))
+        return elapsed
+
+    print('{} records, {} policy records'.format(args.records, args.policy_records))
+    with mock.patch.object(Zone, '_record_index', decode_every_time):
+        uncached = timed('decode per lookup')
+    zone._records_index = None
+    cached = timed('shared index     ')
+    print('{:.0f}x faster'.format(uncached / cached))
+
+    zone._records_index = None
+    tracemalloc.start()
+    zone._record_index()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('record index: {:8.2f} MB'.format(size / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the record id computation, run from the repository root:
+
+    DJANGO_SETTINGS_MODULE=django_project.settings.test python contrib/bench_record_ids.py
+"""
+import argparse
+import os
+import sys
+import timeit
+from unittest import mock
+
+
+def aws_records(count, root):
+    records = []
+    for i in range(count):
+        records.append({
+            'Name': 'www{}.{}'.format(i, root),
+            'Type': 'A',
+            'TTL': 300,
+            'ResourceRecords': [{'Value': '10.0.{}.{}'.format(i // 256 % 256, i % 256)}],
+        })
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the record ids of a large zone.')
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_project.settings.test')
+    import django
+    django.setup()
+
+    from zinc import models
+    from zinc.route53 import record as record_module, Zone
+
+    db_zone = models.Zone(root='example.com.', route53_id='Z0BENCHMARK')
+    zone = Zone(db_zone)
+    records = [record_module.Record.from_aws_record(aws_record, zone=zone)
+               for aws_record in aws_records(args.records, db_zone.root)]
+
+    def ids():
+        # every request decodes the zone again, so time fresh records each round
+        for record in records:
+            record._id = None
+        return [record.id for record in records]
+
+    def uncached_ids():
+        with mock.patch.object(record_module, '_encode', record_module._encode.__wrapped__), \
+                mock.patch.object(record_module, '_record_id',
+                                  record_module._record_id.__wrapped__):
+            zone._hash = None
+            ids()
+
+    uncached = min(timeit.repeat(uncached_ids, number=1, repeat=args.repeat))
+    record_module._encode.cache_clear()
+    record_module._record_id.cache_clear()
+    cold = timeit.timeit(ids, number=1)
+    warm = min(timeit.repeat(ids, number=1, repeat=args.repeat))
+
+    print('{} records'.format(args.records))
+    print('uncached:  {:8.2f} ms'.format(uncached * 1000))
+    print('cold lru:  {:8.2f} ms'.format(cold * 1000))
+    print('warm lru:  {:8.2f} ms ({:.0f}x faster)'.format(warm * 1000, uncached / warm))
+
+
+if __name__ == '__main__':
+    main()
@@ -238,6 +238,10 @@ CELERYBEAT_SCHEDULE = {
         'task': 'zinc.tasks.reconcile_zones',
         'schedule': timedelta(seconds=10),
     },
+    'enqueue_dirty_zones': {
+        'task': 'zinc.tasks.enqueue_dirty_zones',
+        'schedule': timedelta(minutes=5),
+    },
     'update_ns_propagated': {
         'task': 'zinc.tasks.update_ns_propagated',
         'schedule': timedelta(minutes=10),
@@ -264,6 +268,32 @@ CELERYD_HIJACK_ROOT_LOGGER = False
 # Distributed lock server
 LOCK_SERVER_URL = env.str('ZINC_LOCK_SERVER_URL', default='{}/2'.format(REDIS_URL))
 
+# How many zone reconcile tasks a worker may start, in celery's rate_limit format
+ZINC_RECONCILE_RATE_LIMIT = env.str('ZINC_RECONCILE_RATE_LIMIT', default='2/s') or None
+
+# Route53 requests per second shared by the API and all workers (0 disables the rate limiter)
+ZINC_ROUTE53_RATE_LIMIT = env.float('ZINC_ROUTE53_RATE_LIMIT', default=5)
+ZINC_ROUTE53_RATE_LIMIT_BURST = env.float('ZINC_ROUTE53_RATE_LIMIT_BURST', default=5)
+
+# Route53 record set cache, shared by the API and the celery workers
+ZINC_RECORDS_CACHE = 'route53'
+ZINC_RECORDS_CACHE_TTL = env.int('ZINC_RECORDS_CACHE_TTL', default=300)
+# Per process cache of the policy trees, shared by the zones using the same policy
+ZINC_POLICY_TREE_CACHE_TTL = env.int('ZINC_POLICY_TREE_CACHE_TTL', default=60)
+# Per process cache of the record ids, about 40 bytes each
+ZINC_RECORD_ID_CACHE_SIZE = env.int('ZINC_RECORD_ID_CACHE_SIZE', default=65536)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    ZINC_RECORDS_CACHE: {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': env.str('ZINC_RECORDS_CACHE_URL', default='{}/3'.format(REDIS_URL)),
+        'KEY_PREFIX': 'zinc',
+    },
+}
+
 # HASHIDS
 HASHIDS_MIN_LENGTH = 0
 
@@ -295,9 +325,13 @@ HEALTH_CHECK_CONFIG = {
     'ResourcePath': '/status',
     'FullyQualifiedDomainName': env.str('ZINC_HEALTH_CHECK_FQDN', 'node.presslabs.net.'),
 }
+# from how many IPs reconciling their health checks lists all of them instead of one by one
+ZINC_HEALTH_CHECK_BULK_LOAD_MIN_IPS = env.int('ZINC_HEALTH_CHECK_BULK_LOAD_MIN_IPS', default=10)
 
 ZINC_DEFAULT_TTL = env.int('ZINC_DEFAULT_TTL', default=300)
 ZINC_NS_CHECK_RESOLVERS = env.list('ZINC_NS_CHECK_RESOLVERS', default=['8.8.8.8'])
+ZINC_NS_CHECK_CONCURRENCY = env.int('ZINC_NS_CHECK_CONCURRENCY', default=50)
+ZINC_NS_CHECK_RATE = env.float('ZINC_NS_CHECK_RATE', default=100)
 ZONE_OWNERSHIP_COMMENT = env.str('ZINC_ZONE_OWNERSHIP_COMMENT', 'zinc')
 
 AWS_KEY = env.str('ZINC_AWS_KEY', '')
@@ -8,6 +8,12 @@ REST_FRAMEWORK.update({  # noqa: F405
     'DEFAULT_RENDERER_CLASSES': ('rest_framework.renderers.JSONRenderer',)
 })
 
+CACHES[ZINC_RECORDS_CACHE] = {  # noqa: F405
+    'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+}
+
+ZINC_ROUTE53_RATE_LIMIT = 0
+
 LOGGING['loggers']['zinc']['level'] = 'WARN'  # noqa: F405
 
 
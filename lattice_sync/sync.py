@@ -8,7 +8,7 @@ from django.core.exceptions import ValidationError
 from requests.auth import HTTPBasicAuth
 from zipa import lattice  # pylint: disable=no-name-in-module
 
-from zinc import models
+from zinc import models, tasks
 
 
 logger = getLogger('zinc.' + __name__)
@@ -27,7 +27,7 @@ def lattice_factory(url, user, password):
     return lattice
 
 
-def handle_ip(ip_addr, server, locations):
+def server_ip_fields(server, locations):
     enabled = server['state'] == 'configured'
     datacenter_id = int(
         server['datacenter_url'].split('?')[0].split('/')[-1])
@@ -35,27 +35,30 @@ def handle_ip(ip_addr, server, locations):
 
     friendly_name = '{} {}'.format(server['hostname'].split('.')[0],
                                    location)
-    ip = models.IP.objects.filter(
-        ip=ip_addr,
-    ).first()
-    changed = False
-    if ip is None:  # new record
-        ip = models.IP(ip=ip_addr, enabled=enabled)
-        ip.reconcile_healthcheck()
-        changed = True
-    elif ip.enabled != enabled:
-        ip.enabled = enabled
-        ip.mark_policy_records_dirty()
-        changed = True
-    if ip.hostname != server['hostname']:
-        ip.hostname = server['hostname']
-        changed = True
-    if ip.friendly_name != friendly_name:
-        ip.friendly_name = friendly_name
-        changed = True
-    if changed:
-        ip.save()
-    return ip.pk
+    return {
+        'enabled': enabled,
+        'hostname': server['hostname'],
+        'friendly_name': friendly_name,
+    }
+
+
+def lattice_ips(servers, locations):
+    """Map every (normalized) IP address of the servers to its desired fields"""
+    ips = {}
+    for server in servers:
+        fields = server_ip_fields(server, locations)
+        for ip in server.ips:
+            # normalize IP in order to prevent having different values because in db
+            # the IP is cleaned already
+            ip_value = ip['ip']
+            if ':' in ip_value:
+                try:
+                    ip_value = clean_ipv6_address(ip_value)
+                except ValidationError:
+                    logger.error("Bad IPv6 address %s", ip_value)
+                    continue
+            ips[ip_value] = fields
+    return ips
 
 
 def sync(lattice_client):
@@ -69,30 +72,42 @@ def sync(lattice_client):
     ]
     locations = {d['id']: d['location'] for d in lattice_client.datacenters}
 
-    lattice_ip_pks = set()
+    desired_ips = lattice_ips(servers, locations)
+    if not desired_ips:
+        raise AssertionError("Refusing to delete all IPs!")
 
     with transaction.atomic():
-        for server in servers:
-            for ip in server.ips:
-                # normalize IP in order to prevent having different values because in db
-                # the IP is cleaned already
-                ip_value = ip['ip']
-                if ':' in ip_value:
-                    try:
-                        ip_value = clean_ipv6_address(ip_value)
-                    except ValidationError:
-                        logger.error("Bad IPv6 address %s", ip_value)
-                        continue
-
-                ip_pk = handle_ip(ip_value, server, locations)
-                if ip_pk is not None:
-                    lattice_ip_pks.add(ip_pk)
-
-        if not lattice_ip_pks:
-            raise AssertionError("Refusing to delete all IPs!")
-
-        ips_to_remove = set(
-            models.IP.objects.values_list('pk', flat=True)) - lattice_ip_pks
-
-        for ip in models.IP.objects.filter(pk__in=ips_to_remove):
-            ip.soft_delete()
+        existing_ips = {ip.ip: ip for ip in models.IP.objects.all()}
+
+        new_ips = []
+        changed_ips = []
+        for ip_addr, fields in desired_ips.items():
+            ip = existing_ips.get(ip_addr)
+            if ip is None:  # new record
+                new_ips.append(models.IP(ip=ip_addr, **fields))
+                continue
+            changed_fields = [field for field, value in fields.items()
+                              if getattr(ip, field) != value]
+            if not changed_fields:
+                continue
+            for field in changed_fields:
+                setattr(ip, field, fields[field])
+            if 'enabled' in changed_fields:
+                ip.mark_policy_records_dirty()
+            changed_ips.append(ip)
+
+        # IPs removed by an earlier sync are left alone, their trees and health checks are done
+        removed_ips = [ip_addr for ip_addr, ip in existing_ips.items()
+                       if ip_addr not in desired_ips and not ip.deleted]
+
+        models.IP.objects.bulk_create(new_ips)
+        models.IP.objects.bulk_update(changed_ips, ['enabled', 'hostname', 'friendly_name'])
+        models.IP.objects.filter(pk__in=removed_ips).update(deleted=True, enabled=False)
+        models.Policy.bump_tree_version(models.Policy.objects.filter(members__ip__in=removed_ips))
+
+        # the health checks of the new and removed IPs get created and deleted once the
+        # changes are committed, so we don't talk to Route53 while holding the transaction
+        healthcheck_ips = [ip.ip for ip in new_ips] + removed_ips
+        if healthcheck_ips:
+            transaction.on_commit(
+                lambda: tasks.reconcile_healthchecks.delay(ips=healthcheck_ips))
@@ -3,6 +3,7 @@ from celery import shared_task
 from django.conf import settings
 
 from lattice_sync import sync
+from zinc.route53 import rate_limit
 
 logger = get_task_logger(__name__)
 
@@ -11,4 +12,5 @@ logger = get_task_logger(__name__)
 def lattice_sync():
     lattice = sync.lattice_factory(
         settings.LATTICE_URL, settings.LATTICE_USER, settings.LATTICE_PASSWORD)
-    sync.sync(lattice)
+    with rate_limit.priority(rate_limit.BACKGROUND):
+        sync.sync(lattice)
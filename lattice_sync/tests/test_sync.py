@@ -52,17 +52,68 @@ def test_wont_delete_all_ips(boto_client):
 
 @pytest.mark.django_db
 @responses.activate
-def test_removes_ip(boto_client):
+def test_removes_ip(boto_client, django_capture_on_commit_callbacks):
     _mock_lattice_responses()
 
     addr = '1.2.3.4'  # not in the mock response
     G(IP, ip='1.2.3.4')
 
     assert list(IP.objects.all().values_list('ip', flat=True)) == [addr]
-    sync.sync(lattice)
+    with django_capture_on_commit_callbacks(execute=True):
+        sync.sync(lattice)
     assert not IP.objects.filter(ip=addr).exists()
 
 
+@pytest.mark.django_db
+@responses.activate
+def test_ignores_ips_removed_before(boto_client, django_capture_on_commit_callbacks):
+    _mock_lattice_responses()
+    sync.sync(lattice)
+    removed = G(IP, ip='1.2.3.4', deleted=True, enabled=False)
+    member = G(PolicyMember, ip=removed)
+    member.policy.refresh_from_db()
+    tree_version = member.policy.tree_version
+
+    with mock.patch('zinc.tasks.reconcile_healthchecks.delay') as delay, \
+            django_capture_on_commit_callbacks(execute=True):
+        sync.sync(lattice)
+
+    assert not delay.called
+    member.policy.refresh_from_db()
+    assert member.policy.tree_version == tree_version
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_health_checks_are_created_after_commit(boto_client, django_capture_on_commit_callbacks):
+    _mock_lattice_responses()
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        sync.sync(lattice)
+    assert not boto_client.list_health_checks()['HealthChecks']
+
+    for callback in callbacks:
+        callback()
+    checks = {check['HealthCheckConfig']['IPAddress']: check['Id']
+              for check in boto_client.list_health_checks()['HealthChecks']}
+    assert checks == {ip.ip: ip.healthcheck_id for ip in IP.objects.all()}
+    assert sorted(checks) == ['123.123.123.123', '123.123.123.124']
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_sync_updates_ips_in_bulk(boto_client, django_assert_max_num_queries):
+    _mock_lattice_responses()
+    sync.sync(lattice)
+    IP.objects.update(hostname='old.presslabs.net')
+
+    # one query to load the IPs, one bulk update, one soft delete and the savepoints
+    with django_assert_max_num_queries(5):
+        sync.sync(lattice)
+
+    assert set(IP.objects.values_list('hostname', flat=True)) == {'a.presslabs.net'}
+
+
 @pytest.mark.django_db
 @responses.activate
 def test_adds_only_ips_from_servers_in_specified_roles(boto_client):
@@ -59,3 +59,18 @@ def test_policy_with_records(api_client):
 
     assert response.status_code == 200, response
     assert response.data == policy_to_dict(policy)
+
+
+@pytest.mark.django_db
+def test_policy_propagation(api_client):
+    policy = G(m.Policy)
+    zone = G(m.Zone, route53_id='fake/id/1')
+    G(m.PolicyRecord, zone=zone, policy=policy, dirty=False)
+    policy.mark_policy_records_dirty()
+
+    resp = api_client.get('/policies/{}/propagation'.format(policy.id), format='json')
+    assert resp.status_code == 200, resp.data
+    assert resp.data['zones'] == 1
+    assert resp.data['pending_zones'] == 1
+    assert resp.data['started_at'] is not None
+    assert resp.data['finished_at'] is None
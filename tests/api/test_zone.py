@@ -53,6 +53,35 @@ def test_list_zones(api_client, boto_client):
              for zone in response.data])
 
 
+@pytest.mark.django_db
+def test_list_zones_query_count(api_client, boto_client, django_assert_max_num_queries):
+    for i in range(100):
+        zone = G(m.Zone, root='{}.test-zinc.com.'.format(i), route53_id=None)
+        G(m.PolicyRecord, zone=zone, dirty=bool(i % 2))
+
+    # the zone count, the zones page and the session user
+    with django_assert_max_num_queries(3):
+        response = api_client.get('/zones', {'page_size': 100})
+
+    assert len(response.data) == 100
+    assert all(zone['dirty'] == bool(int(zone['root'].split('.')[0]) % 2)
+               for zone in response.data)
+
+
+@pytest.mark.django_db
+def test_detail_zone_policy_records_query_count(api_client, zone, django_assert_num_queries):
+    for i in range(10):
+        G(m.PolicyRecord, zone=zone, name='www{}'.format(i), dirty=False)
+
+    # the zone with its dirty flag, its policy records and their policies
+    with django_assert_num_queries(3):
+        response = api_client.get('/zones/%s' % zone.id)
+
+    assert response.data['dirty'] is False
+    assert len([record for record in response.data['records']
+                if record['type'] == 'POLICY_ROUTED']) == 10
+
+
 @pytest.mark.django_db
 def test_detail_zone(api_client, zone):
     response = api_client.get(
@@ -1,13 +1,18 @@
 # pylint: disable=no-member,unused-argument,protected-access,redefined-outer-name
+import base64
+import json
+
 import pytest
 from unittest.mock import patch
 
 from django_dynamic_fixture import G
 from botocore.exceptions import ClientError
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 
 from tests.fixtures import api_client, boto_client, zone  # noqa: F401
 from tests.utils import (strip_ns_and_soa, hash_test_record, aws_strip_ns_and_soa, aws_sort_key,
-                         get_test_record, record_data_to_aws, get_record_from_base)
+                         get_test_record, record_data_to_aws, get_record_from_base,
+                         hash_policy_record)
 from zinc import models as m
 from zinc import route53
 
@@ -23,6 +28,181 @@ def test_get_record(api_client, zone):
     assert response.data == get_test_record(zone)
 
 
+@pytest.mark.django_db
+def test_list_records(api_client, zone):
+    response = api_client.get('/zones/{}/records'.format(zone.id))
+
+    assert response.status_code == 200
+    assert response.streaming
+    records = json.loads(b''.join(response.streaming_content))
+    assert strip_ns_and_soa(records) == [get_test_record(zone)]
+
+
+@pytest.mark.django_db
+def test_list_records_throttled(api_client, zone, boto_client):
+    throttled = boto_client.exceptions.ThrottlingException(
+        {'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'ListResourceRecordSets')
+    with patch('zinc.route53.zone.Zone._list_aws_records', side_effect=throttled):
+        response = api_client.get('/zones/{}/records'.format(zone.id))
+
+    assert response.status_code == 429
+    assert not response.streaming
+
+
+@pytest.mark.django_db
+def test_list_records_browsable_api(api_client, zone):
+    renderers = [JSONRenderer, BrowsableAPIRenderer]
+    with patch('zinc.views.RecordCreate.renderer_classes', renderers):
+        response = api_client.get('/zones/{}/records'.format(zone.id), HTTP_ACCEPT='text/html')
+
+    assert response.status_code == 200
+    assert not response.streaming
+    assert response['Content-Type'].startswith('text/html')
+    assert strip_ns_and_soa(response.data) == [get_test_record(zone)]
+
+
+@pytest.mark.django_db
+def test_list_records_fields(api_client, zone):
+    with patch('zinc.serializers.record.RecordSerializer.get_id') as get_id:
+        response = api_client.get('/zones/{}/records?fields=name,values'.format(zone.id))
+        records = json.loads(b''.join(response.streaming_content))
+
+    assert {'name': 'test', 'values': ['1.1.1.1']} in records
+    assert {tuple(record) for record in records} == {('name', 'values')}
+    assert not get_id.called
+
+
+@pytest.mark.django_db
+def test_list_records_unknown_fields(api_client, zone):
+    response = api_client.get('/zones/{}/records?fields=name,color'.format(zone.id))
+
+    assert response.status_code == 400
+    assert response.data == {'fields': ['Unknown fields: color.']}
+
+
+def _add_records(zone, names, type_='A', values=('1.2.3.4', )):
+    for name in names:
+        route53.Record(name=name, type=type_, values=list(values), ttl=300,
+                       zone=zone.r53_zone).save()
+    zone.r53_zone.commit()
+
+
+@pytest.mark.django_db
+def test_list_records_pages(api_client, zone):
+    _add_records(zone, ['rec{}'.format(i) for i in range(5)] + ['a.rec1', 'rec1.a'])
+    policy_record = G(m.PolicyRecord, zone=zone, name='www', policy=G(m.Policy, name='pol1'))
+    expected = sorted(record['id'] for record in
+                      json.loads(b''.join(api_client.get(
+                          '/zones/{}/records'.format(zone.id)).streaming_content)))
+
+    pages = []
+    url = '/zones/{}/records?page_size=2'.format(zone.id)
+    while url:
+        response = api_client.get(url)
+        assert response.status_code == 200
+        pages.append([record['id'] for record in response.data])
+        link = response.get('Link')
+        url = link[1:link.index('>')] if link else None
+
+    assert all(len(page) == 2 for page in pages[:-1])
+    assert sorted(record_id for page in pages for record_id in page) == expected
+    # policy records go on the first page
+    assert hash_policy_record(policy_record) in pages[0]
+
+
+def _list_pages(api_client, url):
+    pages = []
+    while url:
+        response = api_client.get(url)
+        assert response.status_code == 200
+        pages.append([record['id'] for record in response.data])
+        link = response.get('Link')
+        url = link[1:link.index('>')] if link else None
+    return pages
+
+
+@pytest.mark.django_db
+def test_list_records_pages_of_policy_records(api_client, zone):
+    policy = G(m.Policy, name='pol1')
+    policy_records = [G(m.PolicyRecord, zone=zone, name='www{}'.format(i), policy=policy)
+                      for i in range(5)]
+
+    pages = _list_pages(api_client, '/zones/{}/records?page_size=2'.format(zone.id))
+
+    assert all(len(page) == 2 for page in pages[:-1])
+    records = [record_id for page in pages for record_id in page]
+    assert records[:5] == [hash_policy_record(policy_record) for policy_record in policy_records]
+    assert sorted(records) == sorted(record.id for record in zone.records)
+
+
+@pytest.mark.django_db
+def test_list_records_pages_skip_hidden_records(api_client, zone, boto_client):
+    _add_records(zone, ['_zn_hidden{}'.format(i) for i in range(5)] + ['rec'])
+    zone.r53_zone._clear_cache()
+
+    with patch.object(boto_client, 'list_resource_record_sets',
+                      wraps=boto_client.list_resource_record_sets) as listing:
+        pages = _list_pages(api_client, '/zones/{}/records?page_size=2&type=A'.format(zone.id))
+
+    expected = [record_id for record_id, record in zone.r53_zone.records().items()
+                if record.type == 'A' and not record.is_hidden]
+    assert len(expected) == 2
+    assert sorted(record_id for page in pages for record_id in page) == sorted(expected)
+    assert {call.kwargs['MaxItems'] for call in listing.call_args_list} == {'2'}
+
+
+@pytest.mark.django_db
+def test_list_records_pages_of_zones_missing_from_route53(api_client, boto_client):
+    for route53_id in (None, 'Z0MISSING'):
+        zone = G(m.Zone, route53_id=route53_id)
+        response = api_client.get('/zones/{}/records?page_size=2'.format(zone.id))
+
+        assert response.status_code == 200
+        assert response.data == []
+        assert 'Link' not in response
+
+
+@pytest.mark.django_db
+def test_list_records_filters(api_client, zone):
+    _add_records(zone, ['rec1', 'rec2', 'other'])
+    _add_records(zone, ['rec3'], type_='TXT', values=('"text"', ))
+
+    for query in ('page_size=1&', ''):
+        records = []
+        url = '/zones/{}/records?{}name=rec&type=A'.format(zone.id, query)
+        while url:
+            response = api_client.get(url)
+            if response.streaming:
+                records.extend(json.loads(b''.join(response.streaming_content)))
+                break
+            records.extend(response.data)
+            link = response.get('Link')
+            url = link[1:link.index('>')] if link else None
+        assert sorted(record['name'] for record in records) == ['rec1', 'rec2']
+
+
+@pytest.mark.django_db
+def test_list_records_invalid_cursor(api_client, zone):
+    response = api_client.get('/zones/{}/records?cursor=garbage'.format(zone.id))
+
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('marker', [
+    ['www', 5, None],
+    ['www', 'A', 7],
+    ['www', 'BOGUS', None],
+    ['www', None, 'set-id'],
+    [None, 'A', None],
+])
+def test_list_records_cursor_with_invalid_marker(api_client, zone, marker):
+    cursor = base64.urlsafe_b64encode(json.dumps(marker).encode('utf-8')).decode('ascii')
+    response = api_client.get('/zones/{}/records?cursor={}'.format(zone.id, cursor))
+
+    assert response.status_code == 404
+
+
 @pytest.mark.django_db
 def test_create_record(api_client, zone, boto_client):
     G(m.Zone)
@@ -501,3 +681,103 @@ def test_txt_record_escape(zone, api_client):
                   response.data['records']))[0]
 
     assert sorted(record['values']) == texts
+
+
+@pytest.mark.django_db
+def test_record_batch(api_client, zone, boto_client):
+    cname = route53.Record(name='www', type='CNAME', values=['example.com'], ttl=300,
+                           zone=zone.r53_zone)
+    cname.save()
+    zone.r53_zone.commit()
+    new_record = {'name': 'record1', 'type': 'A', 'ttl': 300, 'values': ['1.2.3.4']}
+
+    with patch.object(boto_client, 'change_resource_record_sets',
+                      wraps=boto_client.change_resource_record_sets) as change:
+        response = api_client.post(
+            '/zones/{}/records:batch'.format(zone.id),
+            data=[
+                dict(new_record, action='create'),
+                {'action': 'update', 'id': hash_test_record(zone), 'values': ['2.2.2.2']},
+                {'action': 'delete', 'id': cname.id},
+            ],
+            format='json'
+        )
+
+    assert response.status_code == 200, response.data
+    updated_record = dict(get_test_record(zone), values=['2.2.2.2'])
+    assert response.data == [get_record_from_base(new_record, zone), updated_record]
+    assert change.call_count == 1
+    assert aws_strip_ns_and_soa(
+        boto_client.list_resource_record_sets(HostedZoneId=zone.r53_zone.id), zone.root
+    ) == sorted([
+        record_data_to_aws(new_record, zone.root),
+        record_data_to_aws(updated_record, zone.root)
+    ], key=aws_sort_key)
+
+
+@pytest.mark.django_db
+def test_record_batch_builds_only_the_changed_records(api_client, zone, boto_client):
+    _add_records(zone, ['rec{}'.format(i) for i in range(20)])
+    to_record = route53.record.FrozenRecord.to_record
+
+    with patch.object(route53.record.FrozenRecord, 'to_record', autospec=True,
+                      side_effect=to_record) as built:
+        response = api_client.post(
+            '/zones/{}/records:batch'.format(zone.id),
+            data=[{'action': 'update', 'id': hash_test_record(zone), 'values': ['2.2.2.2']}],
+            format='json'
+        )
+
+    assert response.status_code == 200, response.data
+    assert built.call_count == 1
+
+
+@pytest.mark.django_db
+def test_record_batch_is_validated_as_a_whole(api_client, zone, boto_client):
+    with patch.object(boto_client, 'change_resource_record_sets') as change:
+        response = api_client.post(
+            '/zones/{}/records:batch'.format(zone.id),
+            data=[
+                {'action': 'create', 'name': 'new', 'type': 'A', 'values': ['1.2.3.4']},
+                {'action': 'create', 'name': 'new', 'type': 'CNAME', 'values': ['example.com']},
+                {'action': 'delete', 'id': 'missing'},
+            ],
+            format='json'
+        )
+
+    assert response.status_code == 400
+    assert response.data == [{}, {}, {'id': ['Record not found.']}]
+    assert not change.called
+
+    with patch.object(boto_client, 'change_resource_record_sets') as change:
+        response = api_client.post(
+            '/zones/{}/records:batch'.format(zone.id),
+            data=[
+                {'action': 'create', 'name': 'new', 'type': 'A', 'values': ['1.2.3.4']},
+                {'action': 'create', 'name': 'new', 'type': 'CNAME', 'values': ['example.com']},
+            ],
+            format='json'
+        )
+
+    assert response.status_code == 400
+    assert response.data == [
+        {}, {'name': ['A A record of the same name already exists.']}]
+    assert not change.called
+
+
+@pytest.mark.django_db
+def test_record_batch_is_split_in_route53_sized_requests(api_client, zone, boto_client):
+    records = [{'action': 'create', 'name': 'record{}'.format(i), 'type': 'A',
+                'values': ['1.2.3.{}'.format(i)]} for i in range(5)]
+
+    with patch('zinc.route53.zone.MAX_CHANGES', 2), \
+            patch.object(boto_client, 'change_resource_record_sets',
+                         wraps=boto_client.change_resource_record_sets) as change:
+        response = api_client.post('/zones/{}/records:batch'.format(zone.id), data=records,
+                                   format='json')
+
+    assert response.status_code == 200, response.data
+    assert [len(call.kwargs['ChangeBatch']['Changes']) for call in change.call_args_list] == [
+        2, 2, 1]
+    assert {'record{}'.format(i) for i in range(5)} <= {
+        record.name for record in route53.Zone(zone).records().values()}
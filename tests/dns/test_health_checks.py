@@ -1,8 +1,11 @@
 # pylint: disable=no-member,protected-access,redefined-outer-name
+from unittest.mock import patch
+
 import pytest
 import botocore.exceptions
 
 from zinc import models as m
+from zinc.route53 import HealthCheck
 from tests.fixtures import boto_client  # noqa: F401, pylint: disable=unused-import
 
 
@@ -90,3 +93,66 @@ def test_health_check_reconcile(boto_client):
     assert ip.healthcheck_id == original_check_id
     resp = boto_client.get_health_check(HealthCheckId=ip.healthcheck_id)['HealthCheck']
     assert resp['HealthCheckConfig'].items() >= expected_config.items()
+
+
+@pytest.mark.django_db
+def test_reconcile_for_ips_lists_health_checks_once(boto_client):
+    ips = [m.IP.objects.create(ip='1.2.3.{}'.format(i), hostname='fe0{}.presslabs.net.'.format(i))
+           for i in range(3)]
+    ips[0].reconcile_healthcheck()
+    ips[1].reconcile_healthcheck()
+    ips[1].refresh_from_db()
+    changed_check_id = ips[1].healthcheck_id
+    # the config changed in AWS, the health check must be replaced
+    boto_client._health_checks[changed_check_id]['HealthCheck']['HealthCheckConfig']['Port'] = 8080
+
+    with patch.object(boto_client, 'get_health_check') as get_health_check, \
+            patch.object(boto_client, 'create_health_check',
+                         wraps=boto_client.create_health_check) as create_health_check:
+        HealthCheck.reconcile_for_ips(m.IP.objects.all())
+
+    assert not get_health_check.called
+    assert create_health_check.call_count == 2  # the changed check and the new ip
+    configs = {
+        check['HealthCheckConfig']['IPAddress']: check['Id']
+        for check in boto_client.list_health_checks()['HealthChecks']}
+    assert sorted(configs) == ['1.2.3.0', '1.2.3.1', '1.2.3.2']
+    assert changed_check_id not in configs.values()
+    for ip in m.IP.objects.all():
+        assert configs[ip.ip] == ip.healthcheck_id
+
+
+@pytest.mark.django_db
+def test_reconcile_for_few_ips_gets_their_health_checks(boto_client):
+    ips = [m.IP.objects.create(ip='1.2.3.{}'.format(i), hostname='fe0{}.presslabs.net.'.format(i))
+           for i in range(2)]
+    ips[0].reconcile_healthcheck()
+
+    with patch.object(boto_client, 'get_paginator') as get_paginator, \
+            patch.object(boto_client, 'get_health_check',
+                         wraps=boto_client.get_health_check) as get_health_check:
+        HealthCheck.reconcile_for_ips(m.IP.objects.all(), full=False)
+
+    assert not get_paginator.called
+    assert get_health_check.call_count == 1  # the new ip has no health check yet
+    assert all(ip.healthcheck_id for ip in m.IP.objects.all())
+
+
+@pytest.mark.django_db
+def test_reconcile_for_ips_recovers_lost_health_check_id(boto_client):
+    ip = m.IP.objects.create(
+        ip='1.2.3.4',
+        hostname='fe01-mordor.presslabs.net.',
+    )
+    ip.reconcile_healthcheck()
+    ip.refresh_from_db()
+    original_check_id = ip.healthcheck_id
+    ip.healthcheck_id = None
+    ip.save()
+
+    with patch.object(boto_client, 'create_health_check') as create_health_check:
+        HealthCheck.reconcile_for_ips(m.IP.objects.all())
+
+    assert not create_health_check.called
+    ip.refresh_from_db()
+    assert ip.healthcheck_id == original_check_id
@@ -615,7 +615,8 @@ def test_apply_policy_is_not_duplicated(zone):
     G(m.PolicyRecord, zone=zone, policy=policy, name='@')
     G(m.PolicyRecord, zone=zone, policy=policy, name='www')
 
-    with patch('zinc.route53.Policy.reconcile') as policy_reconcile:
+    with patch('zinc.route53.Policy.reconcile', autospec=True,
+               side_effect=route53.Policy.reconcile) as policy_reconcile:
         zone.reconcile()
         policy_reconcile.assert_called_once()
 
@@ -724,7 +725,7 @@ def test_dangling_records(zone, boto_client):
     Tests a dangling record in an existing policy tree gets removed.
     """
     dangling_record = {
-        'Name': '_zn_policy1.us-east-1.' + zone.root,
+        'Name': '_zn_policy1_us-east-1.' + zone.root,
         'Type': 'A',
         'ResourceRecords': [{'Value': '127.1.1.1'}],
         'SetIdentifier': 'test-identifier',
@@ -756,6 +757,112 @@ def test_dangling_records(zone, boto_client):
     assert dangling_record not in records['ResourceRecordSets']
 
 
+@pytest.mark.django_db
+def test_policy_lists_only_its_records(zone, boto_client):
+    for i in range(20):
+        route53.Record(name='rec{}'.format(i), type='A', values=['1.2.3.4'], ttl=300,
+                       zone=zone.r53_zone).save()
+    policy = G(m.Policy, name='policy1')
+    G(m.PolicyMember, ip=create_ip_with_healthcheck(), policy=policy, region='us-east-1')
+    G(m.PolicyRecord, zone=zone, policy=policy, name='record', dirty=True)
+    zone.reconcile()
+    zone.r53_zone._clear_cache()
+
+    with patch.object(boto_client, 'list_resource_record_sets',
+                      wraps=boto_client.list_resource_record_sets) as listing, \
+            patch.object(boto_client, 'get_paginator') as paginator:
+        zone.r53_zone.check_policy_trees()
+        records = route53.Policy(policy=policy, zone=zone.r53_zone).aws_records
+
+    assert not paginator.called
+    assert {call.kwargs['StartRecordName'] for call in listing.call_args_list} == {
+        '_zn_policy1.' + zone.root}
+    assert sorted(record.name for record in records.values()) == [
+        '_zn_policy1', '_zn_policy1_us-east-1']
+
+
+@pytest.mark.django_db
+def test_policy_diffs_cached_frozen_records(zone, boto_client):
+    policy = G(m.Policy, name='policy1')
+    G(m.PolicyMember, ip=create_ip_with_healthcheck(), policy=policy, region='us-east-1')
+    G(m.PolicyRecord, zone=zone, policy=policy, name='record', dirty=True)
+    zone.reconcile()
+    r53_zone = zone.r53_zone
+    r53_zone.records()  # cache the record set
+
+    r53_policy = route53.Policy(policy=policy, zone=r53_zone)
+    with patch.object(route53.Record, 'is_subset', autospec=True,
+                      side_effect=lambda desired, existing: True) as is_subset:
+        r53_policy.reconcile()
+
+    assert is_subset.call_count == len(r53_policy.desired_records) == 2
+    for call in is_subset.call_args_list:
+        desired, existing = call.args
+        assert existing is r53_zone.get_frozen_record(desired.id)
+
+
+@pytest.mark.django_db
+def test_zone_reconcile_lists_only_managed_records(zone, boto_client):
+    for i in range(20):
+        route53.Record(name='rec{}'.format(i), type='A', values=['1.2.3.4'], ttl=300,
+                       zone=zone.r53_zone).save()
+    zone.commit()
+    orphan = route53.Record(name='_zn_gone', type='A', values=['1.2.3.4'], ttl=300,
+                            zone=zone.r53_zone)
+    orphan.save()
+    zone.commit()
+    policy = G(m.Policy, name='policy1')
+    G(m.PolicyMember, ip=create_ip_with_healthcheck(), policy=policy, region='us-east-1')
+    G(m.PolicyRecord, zone=zone, policy=policy, name='record', dirty=True)
+    zone.r53_zone._clear_cache()
+
+    with patch.object(boto_client, 'list_resource_record_sets',
+                      wraps=boto_client.list_resource_record_sets) as listing, \
+            patch.object(boto_client, 'get_paginator') as paginator:
+        zone.reconcile()
+
+    assert not paginator.called
+    assert all(call.kwargs.get('StartRecordName') for call in listing.call_args_list)
+    names = [record['Name'] for record in
+             boto_client.list_resource_record_sets(HostedZoneId=zone.route53_id)[
+                 'ResourceRecordSets']]
+    assert 'record.{}'.format(zone.root) in names
+    assert '_zn_policy1.{}'.format(zone.root) in names
+    assert '_zn_gone.{}'.format(zone.root) not in names
+
+
+@pytest.mark.django_db
+def test_dotted_dangling_records(zone, boto_client):
+    """
+    Policy trees have no dots in their names, so these are out of the range of names a policy
+    lists; reconciling a zone whose record set is cached removes them.
+    """
+    dangling_record = {
+        'Name': '_zn_policy1.us-east-1.' + zone.root,
+        'Type': 'A',
+        'ResourceRecords': [{'Value': '127.1.1.1'}],
+        'TTL': 30
+    }
+    boto_client.change_resource_record_sets(
+        HostedZoneId=zone.route53_id,
+        ChangeBatch={
+            'Comment': 'string',
+            'Changes': [{'Action': 'CREATE', 'ResourceRecordSet': dangling_record}]
+        }
+    )
+    policy = G(m.Policy, name='policy1')
+    G(m.PolicyMember, ip=create_ip_with_healthcheck(), policy=policy, region='us-east-1')
+    G(m.PolicyRecord, zone=zone, policy=policy, name='record', dirty=True)
+    zone.r53_zone._clear_cache()
+
+    assert not route53.Policy(policy=policy, zone=zone.r53_zone).aws_records
+    zone.r53_zone.records()  # cache the record set
+    zone.reconcile()
+
+    records = boto_client.list_resource_record_sets(HostedZoneId=zone.route53_id)
+    assert dangling_record not in records['ResourceRecordSets']
+
+
 @pytest.mark.django_db
 def test_check_policy_trees(zone, boto_client):
     ip = create_ip_with_healthcheck()
@@ -766,7 +873,7 @@ def test_check_policy_trees(zone, boto_client):
     zone.commit()
 
     dangling_record = {
-        'Name': '_zn_policy1.us-east-1.' + zone.root,
+        'Name': '_zn_policy1_us-east-1.' + zone.root,
         'Type': 'A',
         'ResourceRecords': [{'Value': '127.1.1.1'}],
         'SetIdentifier': 'test-identifier',
@@ -901,7 +1008,7 @@ def test_r53_policy_record_aws_records(zone, boto_client):
     Tests a PolicyRecord loads it's records correctly from AWS
     """
     route53.Record(
-        name='_zn_pol1.us-east-1',
+        name='_zn_pol1_us-east-1',
         values=['1.2.3.4'],
         type='A',
         zone=zone.r53_zone,
@@ -913,7 +1020,7 @@ def test_r53_policy_record_aws_records(zone, boto_client):
     route53.Record(
         name='_zn_pol1',
         alias_target={
-            'DNSName': '_zn_pol1.us-east-1.{}'.format(zone.root),
+            'DNSName': '_zn_pol1_us-east-1.{}'.format(zone.root),
             'HostedZoneId': zone.r53_zone.id,
             'EvaluateTargetHealth': False
         },
@@ -925,7 +1032,7 @@ def test_r53_policy_record_aws_records(zone, boto_client):
     policy_record = G(m.PolicyRecord, zone=zone, name='www', policy=policy)
     policy = route53.Policy(zone=zone.r53_zone, policy=policy_record.policy)
     assert set([r.name for r in policy.aws_records.values()]) == set([
-        '_zn_pol1', '_zn_pol1.us-east-1'])
+        '_zn_pol1', '_zn_pol1_us-east-1'])
 
 
 @pytest.mark.django_db
@@ -949,6 +1056,146 @@ def test_r53_policy_expected_aws_records(zone, boto_client):
     ]
 
 
+@pytest.mark.django_db
+def test_r53_policy_trees_built_in_one_query(zone, boto_client, django_assert_num_queries):
+    policies = [G(m.Policy, name='pol{}'.format(i)) for i in range(3)]
+    for policy in policies:
+        for region in regions[:3]:
+            G(m.PolicyMember, policy=policy, region=region, ip=create_ip_with_healthcheck())
+            G(m.PolicyMember, policy=policy, region=region,
+              ip=create_ip_with_healthcheck(ip='2001:db8::{}'.format(m.IP.objects.count())))
+    G(m.PolicyMember, policy=policies[0], region=regions[0], ip=create_ip_with_healthcheck(),
+      enabled=False)
+
+    with django_assert_num_queries(1):
+        r53_policies = route53.Policy.for_policies(zone.r53_zone, policies)
+        trees = [list(r53_policy.desired_records.values()) for r53_policy in r53_policies]
+
+    for policy, tree in zip(policies, trees):
+        expected = list(route53.Policy(zone=zone.r53_zone, policy=policy).desired_records)
+        assert [record.id for record in tree] == expected
+        # 6 members, plus an A and an AAAA alias for each region
+        assert len(tree) == 12
+
+
+@pytest.mark.django_db
+def test_zone_policy_records_committed_at_once(zone, boto_client):
+    policy_records = []
+    for i in range(5):
+        policy = G(m.Policy, name='pol{}'.format(i))
+        G(m.PolicyMember, policy=policy, region=regions[0], ip=create_ip_with_healthcheck())
+        policy_records.append(G(m.PolicyRecord, zone=zone, policy=policy,
+                                name='www{}'.format(i), dirty=True))
+
+    with patch.object(boto_client, 'change_resource_record_sets',
+                      wraps=boto_client.change_resource_record_sets) as change:
+        zone.reconcile()
+
+    assert change.call_count == 1
+    assert not m.PolicyRecord.objects.filter(dirty=True).exists()
+    names = [record['Name'] for record in
+             boto_client.list_resource_record_sets(HostedZoneId=zone.route53_id)[
+                 'ResourceRecordSets']]
+    for policy_record in policy_records:
+        assert '{}.{}'.format(policy_record.name, zone.root) in names
+
+
+@pytest.mark.django_db
+def test_zone_policy_records_fall_back_to_one_at_a_time(zone, boto_client):
+    route53.Record(name='bad', type='CNAME', values=['example.com'], ttl=300,
+                   zone=zone.r53_zone).save()
+    zone.commit()
+    policy = G(m.Policy, name='pol1')
+    G(m.PolicyMember, policy=policy, region=regions[0], ip=create_ip_with_healthcheck())
+    good = G(m.PolicyRecord, zone=zone, policy=policy, name='good', dirty=True)
+    # the alias of this one clashes with the CNAME
+    bad = G(m.PolicyRecord, zone=zone, policy=policy, name='bad', dirty=True)
+
+    with patch.object(boto_client, 'change_resource_record_sets',
+                      wraps=boto_client.change_resource_record_sets) as change:
+        zone.reconcile()
+
+    # the batch, then the tree, each policy record (the bad one fails) and the orphans
+    assert change.call_count == 4
+    good.refresh_from_db()
+    bad.refresh_from_db()
+    assert not good.dirty
+    assert bad.dirty
+    names = [record['Name'] for record in
+             boto_client.list_resource_record_sets(HostedZoneId=zone.route53_id)[
+                 'ResourceRecordSets']]
+    assert 'good.{}'.format(zone.root) in names
+    assert '_zn_pol1.{}'.format(zone.root) in names
+
+
+@pytest.mark.django_db
+def test_zone_policy_records_fall_back_after_a_partial_commit(zone, boto_client):
+    policy = G(m.Policy, name='pol1', routing='weighted')
+    members = [G(m.PolicyMember, policy=policy, region=regions[0], ip=create_ip_with_healthcheck())
+               for _ in range(3)]
+    G(m.PolicyRecord, zone=zone, policy=policy, name='www', dirty=True)
+    zone.reconcile()
+    m.PolicyMember.objects.filter(pk__in=[member.pk for member in members[1:]]) \
+                          .update(enabled=False)
+    policy.mark_policy_records_dirty()
+    commits = []
+    change_resource_record_sets = boto_client.change_resource_record_sets
+
+    def fail_second_commit(**kwargs):
+        commits.append(kwargs)
+        if len(commits) == 2:
+            raise boto_client.exceptions.InvalidChangeBatch(
+                error_response={'Error': {'Code': 'InvalidChangeBatch', 'Message': 'boom'}},
+                operation_name='change_resource_record_sets')
+        return change_resource_record_sets(**kwargs)
+
+    with patch('zinc.route53.zone.MAX_CHANGES', 1), \
+            patch.object(boto_client, 'change_resource_record_sets',
+                         side_effect=fail_second_commit):
+        zone.reconcile()
+
+    # the first deletion was committed before the batch failed, it's not sent again
+    assert [change['Action'] for commit in commits
+            for change in commit['ChangeBatch']['Changes']] == ['DELETE'] * 3
+    assert not m.PolicyRecord.objects.get(zone=zone, name='www').dirty
+    records = [record for record in boto_client.list_resource_record_sets(
+        HostedZoneId=zone.route53_id)['ResourceRecordSets'] if record['Name'].startswith('_zn_')]
+    assert [record['SetIdentifier'] for record in records] == [
+        '{}-{}'.format(members[0].id, regions[0])]
+
+
+@pytest.mark.django_db
+def test_r53_policy_tree_shared_by_zones(boto_client, django_assert_num_queries):
+    route53.policy.tree_templates.clear()
+    policy = G(m.Policy, name='pol1')
+    for region in regions[:2]:
+        G(m.PolicyMember, policy=policy, region=region, ip=create_ip_with_healthcheck())
+    zones = [G(m.Zone, root='zone{}.example.com.'.format(i), route53_id='Z{}'.format(i))
+             for i in range(3)]
+    policy = m.Policy.objects.get(pk=policy.pk)
+
+    # the members are loaded once, for the first zone
+    with django_assert_num_queries(1):
+        trees = [list(route53.Policy.for_policies(db_zone.r53_zone, [policy])[0]
+                      .desired_records.values()) for db_zone in zones]
+
+    for db_zone, tree in zip(zones, trees):
+        aliases = [record for record in tree if record.is_alias]
+        assert len(tree) == 4
+        assert {record.zone for record in tree} == {db_zone.r53_zone}
+        assert [(alias.alias_target['HostedZoneId'], alias.alias_target['DNSName'])
+                for alias in aliases] == [
+            (db_zone.route53_id, '_zn_pol1_{}.{}'.format(region, db_zone.root))
+            for region in regions[:2]
+        ]
+
+    # changing the members invalidates the shared tree
+    G(m.PolicyMember, policy=policy, region=regions[2], ip=create_ip_with_healthcheck())
+    policy = m.Policy.objects.get(pk=policy.pk)
+    tree = route53.Policy.for_policies(zones[0].r53_zone, [policy])[0].desired_records
+    assert len(tree) == 6
+
+
 @pytest.mark.django_db
 def test_r53_policy_reconcile(zone, boto_client):
     policy = G(m.Policy, name='pol1')
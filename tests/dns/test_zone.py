@@ -1,10 +1,12 @@
 # pylint: disable=no-member,protected-access,redefined-outer-name
+from unittest.mock import patch
+
 import botocore.exceptions
 from django_dynamic_fixture import G
 
 import pytest
 from zinc import models, route53
-from tests.fixtures import boto_client, zone  # noqa: F401
+from tests.fixtures import boto_client, shared_record_cache, zone  # noqa: F401
 from tests.utils import hash_test_record
 
 regions = route53.get_local_aws_regions()
@@ -180,6 +182,25 @@ def test_delete_zone_no_zone_id(boto_client):
     assert not models.Zone.objects.filter(pk=db_zone.pk).exists()
 
 
+@pytest.mark.django_db
+def test_reconcile_deleted_zone_with_dirty_policy_record(zone, boto_client):
+    policy = G(models.Policy)
+    G(models.PolicyMember, policy=policy, region=regions[0])
+    G(models.PolicyRecord, zone=zone, policy=policy, dirty=True)
+    policy.mark_policy_records_dirty()
+    zone_pk = zone.pk
+    zone.deleted = True
+    zone.save()
+
+    zone.reconcile()
+
+    assert not models.Zone.objects.filter(pk=zone_pk).exists()
+    with pytest.raises(botocore.exceptions.ClientError):
+        boto_client.get_hosted_zone(Id=zone.route53_id)
+    policy.refresh_from_db()
+    assert policy.propagation_finished_at is not None
+
+
 @pytest.mark.django_db
 def test_zone_need_reconciliation(zone):
 
@@ -201,3 +222,343 @@ def test_zone_get_clean_zones(zone):
     expected_clean = [ok_zone]
     expected = [(z.pk, z.root) for z in expected_clean]
     assert sorted(expected) == sorted([(z.pk, z.root) for z in models.Zone.get_clean_zones()])
+
+
+@pytest.mark.django_db
+def test_records_shared_between_zone_instances(zone, boto_client, shared_record_cache):
+    with patch.object(boto_client, 'get_paginator', wraps=boto_client.get_paginator) as paginator:
+        first = route53.Zone(zone).records()
+        second = route53.Zone(zone).records()
+    assert paginator.call_count == 1
+    assert list(first) == list(second)
+    assert shared_record_cache.stats['hits'] == 1
+    assert shared_record_cache.stats['misses'] == 1
+
+
+@pytest.mark.django_db
+def test_record_cache_logs_its_stats(zone, shared_record_cache, caplog):
+    caplog.set_level('INFO', logger='zinc.route53.cache')
+    with patch.object(shared_record_cache, 'stats_log_interval', 2):
+        route53.Zone(zone).records()
+        route53.Zone(zone).records()
+    assert 'record cache: 1 hits, 1 misses, 50.0% hit ratio' in caplog.messages
+
+
+@pytest.mark.django_db
+def test_iter_records_caches_the_listed_zone(zone, boto_client, shared_record_cache):
+    r53_zone = route53.Zone(zone)
+    records = r53_zone.iter_records()
+    next(records)
+    # nothing is cached until the whole zone is listed
+    assert r53_zone._aws_records is None
+    assert [record.id for record in records]
+    assert r53_zone._aws_records is not None
+
+    with patch.object(boto_client, 'get_paginator') as paginator:
+        listed = [record.id for record in route53.Zone(zone).iter_records()]
+    assert not paginator.called
+    assert listed == list(r53_zone.records())
+
+
+def _pages(r53_zone, max_items):
+    pages = []
+    start = (r53_zone.root, None, None)
+    while start is not None:
+        page, start = r53_zone.records_page(start, max_items=max_items)
+        pages.append([record.id for record in page])
+    return pages
+
+
+@pytest.mark.django_db
+def test_records_page_from_cache_matches_route53(zone, boto_client, shared_record_cache):
+    r53_zone = route53.Zone(zone)
+    for name in ['b', 'a', 'a.b', 'b.a', 'c']:
+        route53.Record(name=name, type='A', values=['1.2.3.4'], ttl=300, zone=r53_zone).save()
+    r53_zone.commit()
+    shared_record_cache.delete(zone.route53_id)
+
+    with patch.object(boto_client, 'list_resource_record_sets',
+                      wraps=boto_client.list_resource_record_sets) as listing:
+        listed = _pages(route53.Zone(zone), max_items=2)
+    assert listing.call_count == len(listed)
+
+    route53.Zone(zone).records()  # cache the record set
+    with patch.object(boto_client, 'list_resource_record_sets') as listing:
+        cached = _pages(route53.Zone(zone), max_items=2)
+    assert not listing.called
+    assert cached == listed
+    assert [record_id for page in listed for record_id in page] == list(r53_zone.records())
+
+
+@pytest.mark.django_db
+def test_commit_invalidates_shared_records(zone, shared_record_cache):
+    reader = route53.Zone(zone)
+    reader.records()
+    writer = route53.Zone(zone)
+    record = route53.Record(name='new', type='A', values=['1.2.3.4'], ttl=300, zone=writer)
+    record.save()
+    writer.commit()
+
+    assert record.id in route53.Zone(zone).records()
+
+
+@pytest.mark.django_db
+def test_commit_applies_changes_to_cached_records(zone, boto_client):
+    r53_zone = zone.r53_zone
+    test_record = r53_zone.records()[hash_test_record(zone)]
+    test_record.deleted = True
+    test_record.save()
+    route53.Record(name='new', type='A', values=['1.2.3.4'], ttl=300, zone=r53_zone).save()
+    with patch.object(boto_client, 'get_paginator') as paginator:
+        r53_zone.commit()
+        records = r53_zone.records()
+    assert not paginator.called
+    assert r53_zone.version == 1
+    assert hash_test_record(zone) not in records
+    # the patched records match what route53 lists, order included
+    assert r53_zone._aws_records == boto_client.list_resource_record_sets(
+        HostedZoneId=zone.route53_id)['ResourceRecordSets']
+
+
+@pytest.mark.django_db
+def test_commit_publishes_next_version(zone, shared_record_cache):
+    r53_zone = route53.Zone(zone)
+    r53_zone.records()
+    route53.Record(name='new', type='A', values=['1.2.3.4'], ttl=300, zone=r53_zone).save()
+    r53_zone.commit()
+
+    records, version = shared_record_cache.get(zone.route53_id)
+    assert version == r53_zone.version == 1
+    assert records == r53_zone._aws_records
+
+
+@pytest.mark.django_db
+def test_stale_shared_records_are_not_served(zone, boto_client, shared_record_cache):
+    route53.Zone(zone).records()
+    # a writer that never listed the zone can't patch the cached records, but must make them stale
+    writer = route53.Zone(zone)
+    record = route53.Record(name='new', type='A', values=['1.2.3.4'], ttl=300, zone=writer)
+    record.save()
+    writer.commit()
+
+    with patch.object(boto_client, 'get_paginator', wraps=boto_client.get_paginator) as paginator:
+        reader = route53.Zone(zone)
+        assert record.id in reader.records()
+    assert paginator.call_count == 1
+    assert reader.version == 1
+
+
+@pytest.mark.django_db
+def test_record_ids_are_computed_once(zone):
+    r53_zone = zone.r53_zone
+    records = r53_zone.records()
+    record_id = hash_test_record(zone)
+    with patch('zinc.route53.record._encode', wraps=route53.record._encode) as encode:
+        assert r53_zone.records().keys() == records.keys()
+        assert [record.id for record in r53_zone.records().values()] == list(records)
+        record = r53_zone.get_record(record_id)
+    assert not encode.called
+    assert record.name == 'test'
+
+
+@pytest.mark.django_db
+def test_record_ids_are_shared_between_zone_instances(zone):
+    record_ids = list(route53.Zone(zone).records())
+    with patch('zinc.route53.record._encode', wraps=route53.record._encode) as encode:
+        assert list(route53.Zone(zone).records()) == record_ids
+    assert not encode.called
+
+
+@pytest.mark.django_db
+def test_record_index_hands_out_copies(zone):
+    r53_zone = zone.r53_zone
+    record = r53_zone.get_record(hash_test_record(zone))
+    record.deleted = True
+    assert not r53_zone.get_record(hash_test_record(zone)).deleted
+    assert r53_zone.get_record('missing') is None
+
+
+@pytest.mark.django_db
+def test_record_index_follows_commits(zone):
+    r53_zone = zone.r53_zone
+    r53_zone.records()
+    record = route53.Record(name='new', type='A', values=['1.2.3.4'], ttl=300, zone=r53_zone)
+    record.save()
+    r53_zone.commit()
+    assert r53_zone.get_record(record.id).values == ['1.2.3.4']
+
+
+@pytest.mark.django_db
+def test_record_index_holds_frozen_records(zone):
+    r53_zone = zone.r53_zone
+    frozen = r53_zone.get_frozen_record(hash_test_record(zone))
+    assert isinstance(frozen, route53.record.FrozenRecord)
+    assert not hasattr(frozen, '__dict__')
+    with pytest.raises(AttributeError):
+        frozen.ttl = 60
+    record = r53_zone.get_record(hash_test_record(zone))
+    assert record.to_aws() == frozen.to_aws()
+    assert record.id == frozen.id
+    assert frozen == route53.record.FrozenRecord(record)
+    assert hash(frozen) == hash(route53.record.FrozenRecord(record))
+
+
+@pytest.mark.django_db
+def test_zone_policy_records_fetched_once(zone, django_assert_num_queries):
+    policy = G(models.Policy, name='pol1')
+    for i in range(3):
+        G(models.PolicyRecord, zone=zone, policy=policy, name='www{}'.format(i))
+    zone = models.Zone.objects.get(pk=zone.pk)
+    zone.r53_zone.records()
+    with django_assert_num_queries(1):
+        records = zone.records
+        policy_records = [record for record in records if record.type == 'POLICY_ROUTED']
+        assert zone.get_record(policy_records[0].id).name == policy_records[0].name
+        assert len(list(zone.iter_records(type='POLICY_ROUTED'))) == 3
+        assert len(zone.records_page()[0]) == len(records)
+    assert sorted(record.name for record in policy_records) == ['www0', 'www1', 'www2']
+
+    # saving one of the zone's policy records drops the ones kept by the zone
+    G(models.PolicyRecord, zone=zone, policy=policy, name='www3')
+    assert 'www3' in [record.name for record in zone.iter_records(type='POLICY_ROUTED')]
+
+
+@pytest.mark.django_db
+def test_zone_forgets_prefetched_policy_records(zone):
+    policy = G(models.Policy, name='pol1')
+    G(models.PolicyRecord, zone=zone, policy=policy, name='www0')
+    zone = models.Zone.objects.prefetch_related('policy_records__policy').get(pk=zone.pk)
+    assert len(list(zone.iter_records(type='POLICY_ROUTED'))) == 1
+
+    G(models.PolicyRecord, zone=zone, policy=policy, name='www1')
+    assert sorted(record.name for record in zone.iter_records(type='POLICY_ROUTED')) == [
+        'www0', 'www1']
+
+
+@pytest.mark.django_db
+def test_frozen_record_diffs(zone):
+    r53_zone = zone.r53_zone
+    frozen = r53_zone.get_frozen_record(hash_test_record(zone))
+    record = r53_zone.get_record(hash_test_record(zone))
+    assert record.is_subset(frozen)
+    record.ttl += 1
+    assert not record.is_subset(frozen)
+    with patch.object(route53.record.FrozenRecord, 'to_aws',
+                      wraps=frozen.to_aws) as to_aws:
+        assert frozen.is_subset(frozen)
+        assert frozen.is_subset(r53_zone.get_frozen_record(hash_test_record(zone)))
+    assert not to_aws.called
+
+
+@pytest.mark.django_db
+def test_full_clean_records_builds_the_index_once(zone):
+    r53_zone = zone.r53_zone
+    records = [route53.Record(name='web{}'.format(i), type='CNAME', values=['test'], ttl=300,
+                              zone=r53_zone, created=True)
+               for i in range(3)]
+    with patch.object(models.Zone, 'record_name_index', autospec=True,
+                      side_effect=models.Zone.record_name_index) as index:
+        assert route53.full_clean_records(r53_zone, records) == [{}, {}, {}]
+    assert index.call_count == 1
+
+
+@pytest.mark.django_db
+def test_full_clean_records_catches_clashes(zone):
+    r53_zone = zone.r53_zone
+    cname = route53.Record(name='test', type='CNAME', values=['example.com'], ttl=300,
+                           zone=r53_zone)
+    assert route53.full_clean_records(r53_zone, [cname]) == [
+        {'name': ['A A record of the same name already exists.']}]
+
+    # clashes within the batch are caught too
+    records = [
+        route53.Record(name='new', type='A', values=['1.2.3.4'], ttl=300, zone=r53_zone),
+        route53.Record(name='new', type='CNAME', values=['example.com'], ttl=300, zone=r53_zone),
+    ]
+    assert route53.full_clean_records(r53_zone, records) == [
+        {}, {'name': ['A A record of the same name already exists.']}]
+
+    # deleting the A record in the same batch makes room for the CNAME
+    test_record = r53_zone.get_record(hash_test_record(zone))
+    test_record.deleted = True
+    assert route53.full_clean_records(r53_zone, [test_record, cname]) == [{}, {}]
+
+
+def _alias(name, target, zone):
+    return route53.Record(name=name, type='A', zone=zone.r53_zone, alias_target={
+        'DNSName': '{}.{}'.format(target, zone.root),
+        'HostedZoneId': zone.r53_zone.id,
+        'EvaluateTargetHealth': False,
+    })
+
+
+@pytest.mark.django_db
+def test_commit_splits_aliases_after_their_targets(zone, boto_client):
+    r53_zone = zone.r53_zone
+    records = [
+        _alias('top', 'middle', zone),
+        _alias('middle', 'leaf', zone),
+        route53.Record(name='leaf', type='A', values=['1.2.3.4'], ttl=300, zone=r53_zone),
+    ]
+    r53_zone.process_records(records)
+    with patch('zinc.route53.zone.MAX_CHANGES', 1), \
+            patch.object(boto_client, 'change_resource_record_sets',
+                         wraps=boto_client.change_resource_record_sets) as change:
+        r53_zone.commit()
+        assert [call.kwargs['ChangeBatch']['Changes'][0]['ResourceRecordSet']['Name']
+                for call in change.call_args_list] == [
+            'leaf.test-zinc.net.', 'middle.test-zinc.net.', 'top.test-zinc.net.']
+
+        for record in records:
+            record.deleted = True
+        r53_zone.process_records(records[::-1])
+        change.reset_mock()
+        r53_zone.commit()
+        assert [call.kwargs['ChangeBatch']['Changes'][0]['ResourceRecordSet']['Name']
+                for call in change.call_args_list] == [
+            'top.test-zinc.net.', 'middle.test-zinc.net.', 'leaf.test-zinc.net.']
+    assert r53_zone._change_batch == []
+    assert hash_test_record(zone) in route53.Zone(zone).records()
+
+
+def test_split_changes_by_size():
+    def change(action, name, values):
+        return {'Action': action, 'ResourceRecordSet': {
+            'Name': name, 'Type': 'TXT', 'ResourceRecords': [{'Value': v} for v in values]}}
+
+    changes = [
+        change('CREATE', 'a.example.com.', ['x' * 10] * 2),
+        change('UPSERT', 'b.example.com.', ['x' * 10]),
+        change('CREATE', 'c.example.com.', ['x' * 30]),
+        change('DELETE', 'd.example.com.', ['x' * 5]),
+    ]
+    with patch('zinc.route53.zone.MAX_VALUES_LENGTH', 45):
+        assert route53.zone._split_changes(changes) == [changes[:2], changes[2:]]
+    with patch('zinc.route53.zone.MAX_RESOURCE_RECORDS', 4):
+        # upserts count twice
+        assert route53.zone._split_changes(changes) == [changes[:2], changes[2:]]
+    assert route53.zone._split_changes(changes) == [changes]
+    assert route53.zone._split_changes([]) == []
+
+
+@pytest.mark.django_db
+def test_delete_zone_records_in_batches(zone, boto_client):
+    r53_zone = zone.r53_zone
+    r53_zone.process_records([
+        route53.Record(name='leaf', type='A', values=['1.2.3.4'], ttl=300, zone=r53_zone),
+        _alias('top', 'leaf', zone),
+    ])
+    r53_zone.commit()
+    with patch('zinc.route53.zone.MAX_CHANGES', 1), \
+            patch.object(boto_client, 'change_resource_record_sets',
+                         wraps=boto_client.change_resource_record_sets) as change:
+        r53_zone._delete_records()
+    assert change.call_count == 3
+    assert [record['Type'] for record in boto_client.list_resource_record_sets(
+        HostedZoneId=zone.route53_id)['ResourceRecordSets']] == ['NS', 'SOA']
+
+
+def test_escape_dns_name():
+    assert route53.zone._escape_dns_name('*.Example.com.') == '\\052.example.com.'
+    assert route53.zone._escape_dns_name('\\052.example.com.') == '\\052.example.com.'
+    assert route53.zone._escape_dns_name('_zn_pol-1.example.com.') == '_zn_pol-1.example.com.'
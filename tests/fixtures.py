@@ -112,8 +112,17 @@ class FakePaginator:
         self._op_name = op_name
 
     def paginate(self, **kwargs):
-        """return a one element list, so we can pretent to paginate"""
-        return [getattr(self._client, self._op_name)(**kwargs)]
+        """follow the record set markers of truncated pages, the other calls have one page"""
+        page = getattr(self._client, self._op_name)(**kwargs)
+        yield page
+        while page.get('IsTruncated'):
+            kwargs.update(StartRecordName=page['NextRecordName'],
+                          StartRecordType=page['NextRecordType'])
+            kwargs.pop('StartRecordIdentifier', None)
+            if 'NextRecordIdentifier' in page:
+                kwargs['StartRecordIdentifier'] = page['NextRecordIdentifier']
+            page = getattr(self._client, self._op_name)(**kwargs)
+            yield page
 
 
 class Moto:
@@ -121,6 +130,7 @@ class Moto:
 
     def __init__(self):
         self._zones = {}
+        self._zone_names = {}
         self._health_checks = {}
         self._health_checks_caller_reference = {}
         self.exceptions = route53.client.get_client().exceptions
@@ -131,6 +141,7 @@ class Moto:
     def create_hosted_zone(self, Name, CallerReference, HostedZoneConfig):
         zone_id = "{}/{}/{}".format(random_ascii(4), random_ascii(4), random_ascii(4))
         self._zones[zone_id] = {}
+        self._zone_names[zone_id] = Name
         self.change_resource_record_sets(
             zone_id,
             {'Changes': [
@@ -194,6 +205,7 @@ class Moto:
         check = {
             'HealthCheck': {
                 'Id': check_id,
+                'CallerReference': CallerReference,
                 'HealthCheckConfig': HealthCheckConfig,
             }
         }
@@ -217,9 +229,12 @@ class Moto:
                 operation_name='get_health_check',
             )
 
+    def list_health_checks(self):
+        return {'HealthChecks': [check['HealthCheck'] for check in self._health_checks.values()]}
+
     def get_hosted_zone(self, Id):
         try:
-            return self._zones[Id]
+            records = self._zones[Id]
         except KeyError:
             raise self.exceptions.NoSuchHostedZone(
                 error_response={
@@ -231,6 +246,13 @@ class Moto:
                 },
                 operation_name='get_hosted_zone',
             )
+        name = self._zone_names[Id]
+        ns_record = records.get(self._record_key(name=name, rtype='NS'))
+        name_servers = [value['Value'] for value in ns_record['ResourceRecords']] if ns_record else []
+        return {
+            'HostedZone': {'Id': Id, 'Name': name},
+            'DelegationSet': {'NameServers': [ns.rstrip('.') for ns in name_servers]},
+        }
 
     def cleanup(self):
         self._zones = {}
@@ -320,31 +342,57 @@ class Moto:
                 operation_name='change_resource_record_sets',
             )
 
+    def _check_record_exists(self, records, change, changes):
+        record = change['ResourceRecordSet']
+        if self._record_key(record) not in records:
+            raise self.exceptions.InvalidChangeBatch(
+                error_response={
+                    'Error': {
+                        'Code': 'InvalidChangeBatch',
+                        'Message': (
+                            "Record {} of type {} not found".format(
+                                record['Name'], record['Type'])),
+                        'Type': 'Sender'
+                    },
+                },
+                operation_name='change_resource_record_sets',
+            )
+
     def change_resource_record_sets(self, HostedZoneId, ChangeBatch):
         records = self._zones[HostedZoneId]
+        # like Route53, apply the whole batch or none of it
+        applied = dict(records)
 
         changes = ChangeBatch['Changes']
-        for change in changes:
-            record_set = change['ResourceRecordSet']
-            if change['Action'] == 'DELETE':
-                self._remove_record(HostedZoneId, record_set)
-            elif change['Action'] == 'UPSERT':
-                if self._record_key(record_set) in records:
+        try:
+            for change in changes:
+                record_set = change['ResourceRecordSet']
+                if change['Action'] == 'DELETE':
+                    self._check_record_exists(records, change, changes)
                     self._remove_record(HostedZoneId, record_set)
-                self._check_cname_clash(records, change, changes)
-                self._check_alias_target_valid(records, change, changes)
-                self._add_record(HostedZoneId, record_set)
-            elif change['Action'] == 'CREATE':
-                self._check_alias_target_valid(records, change, changes)
-                self._check_cname_clash(records, change, changes)
-                self._check_record_doesnt_exist(records, change, changes)
-                self._add_record(HostedZoneId, record_set)
-            else:
-                raise AssertionError(change['Action'])
-
-    def list_resource_record_sets(self, HostedZoneId=None):
+                elif change['Action'] == 'UPSERT':
+                    if self._record_key(record_set) in records:
+                        self._remove_record(HostedZoneId, record_set)
+                    self._check_cname_clash(records, change, changes)
+                    self._check_alias_target_valid(records, change, changes)
+                    self._add_record(HostedZoneId, record_set)
+                elif change['Action'] == 'CREATE':
+                    self._check_alias_target_valid(records, change, changes)
+                    self._check_cname_clash(records, change, changes)
+                    self._check_record_doesnt_exist(records, change, changes)
+                    self._add_record(HostedZoneId, record_set)
+                else:
+                    raise AssertionError(change['Action'])
+        except Exception:
+            records.clear()
+            records.update(applied)
+            raise
+
+    def list_resource_record_sets(self, HostedZoneId=None, StartRecordName=None,
+                                  StartRecordType=None, StartRecordIdentifier=None, MaxItems='300'):
         """
-        Return record sets in order.
+        Return record sets in order, starting at the StartRecord* markers and at most MaxItems
+        of them, like Route53 does.
 
         See boto3 documenation:
         http://boto3.readthedocs.io/en/latest/reference/services/route53.html#Route53.Client.list_resource_record_sets
@@ -362,8 +410,29 @@ class Moto:
                 },
                 operation_name='list_resource_record_sets',
             )
-        records = [v for (k, v) in sorted(list(zone.items()))]
-        return {'ResourceRecordSets': records}
+        def sort_key(key):
+            name, rtype, set_id = key
+            return (name, rtype, set_id or '')
+
+        keys = sorted(zone, key=sort_key)
+        if StartRecordName is not None:
+            start = sort_key(self._record_key(
+                {'SetIdentifier': StartRecordIdentifier}, name=StartRecordName,
+                rtype=StartRecordType or ''))
+            keys = [key for key in keys if sort_key(key) >= start]
+        max_items = int(MaxItems)
+        response = {
+            'ResourceRecordSets': [zone[key] for key in keys[:max_items]],
+            'IsTruncated': len(keys) > max_items,
+            'MaxItems': MaxItems,
+        }
+        if response['IsTruncated']:
+            next_record = zone[keys[max_items]]
+            response['NextRecordName'] = next_record['Name']
+            response['NextRecordType'] = next_record['Type']
+            if 'SetIdentifier' in next_record:
+                response['NextRecordIdentifier'] = next_record['SetIdentifier']
+        return response
 
 
 @pytest.fixture(
@@ -385,6 +454,17 @@ def boto_client(request):
     return client
 
 
+@pytest.fixture
+def shared_record_cache(settings):
+    """Back the route53 record set cache by local memory instead of the dummy test cache"""
+    settings.CACHES = dict(settings.CACHES, route53={
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'zinc-records-{}'.format(uuid.uuid4()),
+    })
+    route53.cache.record_cache.reset_stats()
+    return route53.cache.record_cache
+
+
 @pytest.fixture()
 def zone(request, boto_client):
     client = boto_client
@@ -1,7 +1,7 @@
 import pytest
 from django.core.exceptions import ValidationError
 
-from zinc.models import Policy
+from zinc.models import IP, Policy, PolicyMember
 
 
 @pytest.mark.django_db
@@ -22,3 +22,18 @@ def test_policy_name_validation_regex():
 
     with pytest.raises(ValidationError):
         Policy(name="UpperCaseName").full_clean()
+
+
+@pytest.mark.django_db
+def test_policy_tree_version_bumped_by_ip_changes():
+    policy = Policy.objects.create(name="pol1")
+    ip = IP.objects.create(ip='1.2.3.4', hostname='ip1')
+    PolicyMember.objects.create(policy=policy, ip=ip)
+    version = Policy.objects.get(pk=policy.pk).tree_version
+
+    ip.save(update_fields=['friendly_name'])
+    assert Policy.objects.get(pk=policy.pk).tree_version == version
+
+    ip.healthcheck_id = 'hc-1'
+    ip.save(update_fields=['healthcheck_id'])
+    assert Policy.objects.get(pk=policy.pk).tree_version == version + 1
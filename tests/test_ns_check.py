@@ -2,11 +2,18 @@ import json
 from unittest import mock
 
 import pytest
+from dns.exception import DNSException
 
 from zinc import ns_check, models
 from tests.fixtures import zone, boto_client, Moto  # noqa: F401
 
 
+def async_resolver(name_servers):
+    resolver = mock.Mock()
+    resolver.resolve = mock.AsyncMock(return_value=name_servers)
+    return resolver
+
+
 @pytest.mark.parametrize("boto_client", [Moto], ids=['fake_boto'], indirect=True)
 @pytest.mark.django_db
 def test_is_ns_propagated(zone, boto_client):
@@ -62,9 +69,8 @@ def test_is_ns_propagated_false(zone):
 @pytest.mark.django_db
 def test_update_ns_propagated(zone):
     assert zone.ns_propagated is False
-    resolver = mock.Mock()
-    resolver.query.return_value = ["test_ns1.presslabs.net", "test_ns2.presslabs.net"]
-    with mock.patch('zinc.ns_check.get_resolver', lambda: resolver):
+    resolver = async_resolver(["test_ns1.presslabs.net", "test_ns2.presslabs.net"])
+    with mock.patch('zinc.ns_check.get_async_resolvers', lambda: [resolver]):
         models.Zone.update_ns_propagated()
     zone.refresh_from_db()
     assert zone.ns_propagated
@@ -74,9 +80,8 @@ def test_update_ns_propagated(zone):
 @pytest.mark.django_db
 def test_update_ns_propagated_false(zone):
     assert zone.ns_propagated is False
-    resolver = mock.Mock()
-    resolver.query.return_value = ["some_other_ns.example.com"]
-    with mock.patch('zinc.ns_check.get_resolver', lambda: resolver):
+    resolver = async_resolver(["some_other_ns.example.com"])
+    with mock.patch('zinc.ns_check.get_async_resolvers', lambda: [resolver]):
         models.Zone.update_ns_propagated()
     zone.refresh_from_db()
     assert zone.ns_propagated is False
@@ -87,9 +92,8 @@ def test_update_ns_propagated_false(zone):
 def test_update_ns_propagated_updates_cached_ns_records_empty_cache(zone):
     assert zone.cached_ns_records is None
     ns_records = ["test_ns1.presslabs.net", "test_ns2.presslabs.net"]
-    resolver = mock.Mock()
-    resolver.query.return_value = ["test_ns1.presslabs.net", "test_ns2.presslabs.net"]
-    with mock.patch('zinc.ns_check.get_resolver', lambda: resolver):
+    resolver = async_resolver(["test_ns1.presslabs.net", "test_ns2.presslabs.net"])
+    with mock.patch('zinc.ns_check.get_async_resolvers', lambda: [resolver]):
         models.Zone.update_ns_propagated()
     zone.refresh_from_db()
     assert set(json.loads(zone.cached_ns_records)) == set(ns_records)
@@ -102,10 +106,73 @@ def test_update_ns_propagated_updates_cached_ns_records(zone):
     zone.cached_ns_records = json.dumps(["ns1.example.com"])
     zone.save()
     ns_records = ["test_ns1.presslabs.net", "test_ns2.presslabs.net"]
-    resolver = mock.Mock()
-    resolver.query.return_value = ["test_ns1.presslabs.net", "test_ns2.presslabs.net"]
-    with mock.patch('zinc.ns_check.get_resolver', lambda: resolver):
+    resolver = async_resolver(["test_ns1.presslabs.net", "test_ns2.presslabs.net"])
+    with mock.patch('zinc.ns_check.get_async_resolvers', lambda: [resolver]):
         models.Zone.update_ns_propagated()
     zone.refresh_from_db()
     assert set(json.loads(zone.cached_ns_records)) == set(ns_records)
     assert zone.ns_propagated
+
+
+@pytest.mark.parametrize("boto_client", [Moto], ids=['fake_boto'], indirect=True)
+@pytest.mark.django_db
+def test_update_ns_propagated_skips_unresolved_zones(zone):
+    zone.ns_propagated = True
+    zone.save()
+    resolver = mock.Mock()
+    resolver.resolve = mock.AsyncMock(side_effect=DNSException("timeout"))
+    with mock.patch('zinc.ns_check.get_async_resolvers', lambda: [resolver]):
+        models.Zone.update_ns_propagated()
+    zone.refresh_from_db()
+    assert zone.ns_propagated
+
+
+def test_resolve_name_servers_spreads_queries_over_resolvers():
+    first = async_resolver(["ns2.example.com", "ns1.example.com"])
+    second = mock.Mock()
+    second.resolve = mock.AsyncMock(side_effect=DNSException("timeout"))
+    resolved = ns_check.resolve_name_servers(
+        ['a.com.', 'b.com.', 'c.com.'], resolvers=[first, second], concurrency=2, rate=1000)
+
+    assert resolved[0] == resolved[2] == ["ns1.example.com", "ns2.example.com"]
+    assert isinstance(resolved[1], ns_check.CouldNotResolve)
+    assert [call.args for call in first.resolve.call_args_list] == [('a.com.', 'NS'), ('c.com.', 'NS')]
+
+
+@pytest.mark.parametrize("boto_client", [Moto], ids=['fake_boto'], indirect=True)
+@pytest.mark.django_db
+def test_is_ns_propagated_cached_skips_route53(zone, boto_client):
+    name_servers = ["test_ns1.presslabs.net", "test_ns2.presslabs.net"]
+    zone.cached_ns_records = json.dumps(name_servers)
+    zone.save()
+    resolver = mock.Mock()
+    resolver.query.return_value = name_servers
+    with mock.patch.object(boto_client, 'get_paginator') as paginator, \
+            mock.patch.object(boto_client, 'get_hosted_zone') as get_hosted_zone:
+        assert ns_check.is_ns_propagated(zone, resolver=resolver)
+    assert not paginator.called
+    assert not get_hosted_zone.called
+
+
+@pytest.mark.parametrize("boto_client", [Moto], ids=['fake_boto'], indirect=True)
+@pytest.mark.django_db
+def test_is_ns_propagated_uses_delegation_set(zone, boto_client):
+    resolver = mock.Mock()
+    resolver.query.return_value = ["test_ns1.presslabs.net.", "test_ns2.presslabs.net."]
+    with mock.patch.object(boto_client, 'get_paginator') as paginator:
+        assert ns_check.is_ns_propagated(zone, resolver=resolver)
+    assert not paginator.called
+    zone.refresh_from_db()
+    assert json.loads(zone.cached_ns_records) == ["test_ns1.presslabs.net.", "test_ns2.presslabs.net."]
+
+
+@pytest.mark.parametrize("boto_client", [Moto], ids=['fake_boto'], indirect=True)
+@pytest.mark.django_db
+def test_is_ns_propagated_false_with_current_cache_skips_listing(zone, boto_client):
+    zone.cached_ns_records = json.dumps(["test_ns1.presslabs.net.", "test_ns2.presslabs.net."])
+    zone.save()
+    resolver = mock.Mock()
+    resolver.query.return_value = ["some_other_ns.example.com."]
+    with mock.patch.object(boto_client, 'get_paginator') as paginator:
+        assert ns_check.is_ns_propagated(zone, resolver=resolver) is False
+    assert not paginator.called
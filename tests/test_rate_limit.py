@@ -0,0 +1,46 @@
+from unittest import mock
+
+import redis
+
+from zinc.route53 import rate_limit
+
+
+def make_limiter(waits):
+    limiter = rate_limit.RateLimiter(url='redis://fake', rate=5, capacity=5, max_wait=1)
+    limiter._bucket = mock.Mock()
+    limiter._bucket.try_acquire.side_effect = waits
+    return limiter
+
+
+def test_acquire_waits_for_a_token():
+    limiter = make_limiter([0.2, 0])
+    with mock.patch('zinc.route53.rate_limit.time.sleep') as sleep:
+        limiter.acquire()
+    sleep.assert_called_once_with(0.2)
+    assert limiter._bucket.try_acquire.call_count == 2
+
+
+def test_priority_reserves_tokens():
+    limiter = make_limiter([0, 0, 0])
+    limiter.before_send(request=None)
+    with rate_limit.priority(rate_limit.BACKGROUND):
+        limiter.before_send(request=None)
+        with rate_limit.priority(rate_limit.RECONCILE):
+            limiter.before_send(request=None)
+    assert rate_limit.current_priority() == rate_limit.INTERACTIVE
+    assert [call.kwargs['reserve'] for call in limiter._bucket.try_acquire.call_args_list] == [
+        0, 2, 1]
+
+
+def test_acquire_gives_up_after_max_wait():
+    limiter = make_limiter([0.6, 0.6, 0.6, 0.6])
+    with mock.patch('zinc.route53.rate_limit.time.monotonic', side_effect=[0, 0, 0.6, 1.2]), \
+            mock.patch('zinc.route53.rate_limit.time.sleep') as sleep:
+        limiter.acquire()
+    assert [call.args[0] for call in sleep.call_args_list] == [0.6, 0.4]
+
+
+def test_acquire_lets_requests_through_without_redis():
+    limiter = make_limiter(redis.ConnectionError('no redis'))
+    limiter.acquire()
+    assert limiter._bucket.try_acquire.call_count == 1
@@ -0,0 +1,206 @@
+# pylint: disable=no-member,unused-argument,redefined-outer-name
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.db import connection
+from django.utils import timezone
+from django_dynamic_fixture import G
+
+from zinc import models, tasks
+
+
+@pytest.fixture
+def redis_client():
+    client = mock.Mock()
+    with mock.patch('zinc.tasks._redis_client', return_value=client), \
+            mock.patch('zinc.tasks.redis_lock.Lock') as lock:
+        lock.return_value.acquire.return_value = True
+        yield client
+
+
+@pytest.mark.django_db
+def test_reconcile_zones_fans_out_once_per_zone(redis_client):
+    dirty_zone = G(models.Zone, route53_id='fake/id/1', deleted=False)
+    G(models.PolicyRecord, zone=dirty_zone, dirty=True)
+    G(models.PolicyRecord, zone=dirty_zone, dirty=True)
+    deleted_zone = G(models.Zone, route53_id='fake/id/2', deleted=False)
+    with mock.patch('zinc.tasks.aws_delete_zone.delay'):
+        deleted_zone.soft_delete()
+    G(models.Zone, route53_id='fake/id/3', deleted=False)  # clean zone
+    redis_client.set.return_value = True
+
+    with mock.patch('zinc.tasks.reconcile_zone.delay') as delay:
+        tasks.reconcile_zones()
+
+    assert sorted(call.args for call in delay.call_args_list) == sorted([
+        (dirty_zone.pk, ), (deleted_zone.pk, )])
+
+
+@pytest.mark.django_db
+def test_reconcile_zones_skips_zones_backing_off(redis_client):
+    zone = G(models.Zone, route53_id='fake/id/1', deleted=False)
+    G(models.PolicyRecord, zone=zone, dirty=True)
+    models.DirtyZone.objects.get(zone=zone).failed('boom')
+    redis_client.set.return_value = True
+
+    with mock.patch('zinc.tasks.reconcile_zone.delay') as delay:
+        tasks.reconcile_zones()
+
+    assert not delay.called
+
+
+@pytest.mark.django_db
+def test_enqueue_dirty_zones(redis_client):
+    no_id_zone = G(models.Zone, route53_id=None, deleted=False)
+    failed_zone = G(models.Zone, route53_id='fake/id/1', deleted=False)
+    G(models.PolicyRecord, zone=failed_zone, dirty=True)
+    models.DirtyZone.objects.get(zone=failed_zone).failed('boom')
+    G(models.Zone, route53_id='fake/id/2', deleted=False)  # clean zone
+
+    tasks.enqueue_dirty_zones()
+
+    assert sorted(models.DirtyZone.due().values_list('zone_id', flat=True)) == [no_id_zone.pk]
+    # the sweep leaves the backoff of failed zones alone
+    assert models.DirtyZone.objects.get(zone=failed_zone).attempts == 1
+
+
+@pytest.mark.django_db
+def test_push_requeues_without_upserts(redis_client):
+    failed_zone = G(models.Zone, route53_id='fake/id/1', deleted=False)
+    G(models.PolicyRecord, zone=failed_zone, dirty=True)
+    models.DirtyZone.objects.get(zone=failed_zone).failed('boom')
+    new_zone = G(models.Zone, route53_id='fake/id/2', deleted=False)
+
+    # like MySQL, which can't upsert on a given unique field
+    with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+        models.DirtyZone.push([failed_zone.pk, new_zone.pk])
+
+    assert sorted(models.DirtyZone.due().values_list('zone_id', flat=True)) == [
+        failed_zone.pk, new_zone.pk]
+
+
+@pytest.mark.django_db
+def test_reconcile_zones_skips_queued_zones(redis_client):
+    zone = G(models.Zone, route53_id=None, deleted=False)
+    models.DirtyZone.push([zone.pk])
+    redis_client.set.return_value = None  # the zone is already queued
+
+    with mock.patch('zinc.tasks.reconcile_zone.delay') as delay:
+        tasks.reconcile_zones()
+
+    assert not delay.called
+
+
+@pytest.mark.django_db
+def test_reconcile_zone(redis_client):
+    zone = G(models.Zone, route53_id=None, deleted=False)
+
+    with mock.patch('zinc.models.Zone.reconcile') as reconcile:
+        tasks.reconcile_zone(zone.pk)
+
+    assert reconcile.called
+    redis_client.delete.assert_called_once_with(tasks._queued_key(zone.pk))
+
+
+@pytest.mark.django_db
+def test_reconcile_zone_locked_can_be_queued_again(redis_client):
+    zone = G(models.Zone, route53_id=None, deleted=False)
+
+    with mock.patch('zinc.tasks.redis_lock.Lock') as lock, \
+            mock.patch('zinc.models.Zone.reconcile') as reconcile:
+        lock.return_value.acquire.return_value = False
+        tasks.reconcile_zone(zone.pk)
+
+    assert not reconcile.called
+    redis_client.delete.assert_called_once_with(tasks._queued_key(zone.pk))
+
+
+@pytest.mark.django_db
+def test_reconcile_zone_dequeues_clean_zone(redis_client):
+    zone = G(models.Zone, route53_id='fake/id/1', deleted=False)
+    G(models.PolicyRecord, zone=zone, dirty=True)
+
+    def reconcile(self):
+        self.policy_records.update(dirty=False)
+
+    with mock.patch('zinc.models.Zone.reconcile', reconcile):
+        tasks.reconcile_zone(zone.pk)
+
+    assert not models.DirtyZone.objects.exists()
+
+
+@pytest.mark.django_db
+def test_reconcile_zone_keeps_zone_queued_again_meanwhile(redis_client):
+    zone = G(models.Zone, route53_id='fake/id/1', deleted=False)
+    G(models.PolicyRecord, zone=zone, dirty=True)
+
+    def reconcile(self):
+        self.policy_records.update(dirty=False)
+        models.DirtyZone.objects.filter(zone=self).update(
+            queued_at=timezone.now() + timedelta(seconds=1))
+
+    with mock.patch('zinc.models.Zone.reconcile', reconcile):
+        tasks.reconcile_zone(zone.pk)
+
+    entry = models.DirtyZone.objects.get(zone=zone)
+    assert entry.attempts == 0
+
+
+@pytest.mark.django_db
+def test_reconcile_zone_backs_off_on_failure(redis_client):
+    zone = G(models.Zone, route53_id='fake/id/1', deleted=False)
+    G(models.PolicyRecord, zone=zone, dirty=True)
+
+    with mock.patch('zinc.models.Zone.reconcile', side_effect=Exception('boom')):
+        tasks.reconcile_zone(zone.pk)
+        tasks.reconcile_zone(zone.pk)
+
+    entry = models.DirtyZone.objects.get(zone=zone)
+    assert entry.attempts == 2
+    assert 'boom' in entry.last_error
+    assert entry.next_attempt_at > timezone.now() + timedelta(seconds=15)
+    assert not models.DirtyZone.due().exists()
+
+
+@pytest.mark.django_db
+def test_policy_change_fans_out_its_zones(redis_client, django_capture_on_commit_callbacks):
+    policy = G(models.Policy)
+    zones = [G(models.Zone, route53_id='fake/id/{}'.format(i), deleted=False) for i in range(2)]
+    for zone in zones:
+        G(models.PolicyRecord, zone=zone, policy=policy, dirty=False)
+    G(models.PolicyRecord, zone=zones[0], policy=policy, dirty=False)
+    other_zone = G(models.Zone, route53_id='fake/id/3', deleted=False)
+    G(models.PolicyRecord, zone=other_zone, dirty=True)
+    redis_client.set.return_value = True
+
+    with mock.patch('zinc.tasks.reconcile_zone.delay') as delay, \
+            django_capture_on_commit_callbacks(execute=True):
+        policy.mark_policy_records_dirty()
+
+    assert sorted(call.args for call in delay.call_args_list) == sorted(
+        (zone.pk, ) for zone in zones)
+
+
+@pytest.mark.django_db
+def test_policy_propagation_finishes_with_its_last_zone():
+    policy = G(models.Policy)
+    zones = [G(models.Zone, route53_id='fake/id/{}'.format(i), deleted=False) for i in range(2)]
+    for zone in zones:
+        G(models.PolicyRecord, zone=zone, policy=policy, dirty=False)
+    policy.mark_policy_records_dirty()
+    policy.refresh_from_db()
+    assert policy.propagation()['pending_zones'] == 2
+
+    for zone in zones:
+        zone.policy_records.update(dirty=False)
+        models.Policy.finish_propagation([policy.pk])
+        policy.refresh_from_db()
+        if zone != zones[-1]:
+            assert policy.propagation_finished_at is None
+
+    progress = policy.propagation()
+    assert progress['zones'] == 2
+    assert progress['pending_zones'] == 0
+    assert progress['finished_at'] >= progress['started_at']
+    assert progress['duration'] >= 0
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.10 on 2026-10-18 01:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zinc', '0011_alter_policy_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirtyZone',
+            fields=[
+                ('zone', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                              related_name='dirty_entry', serialize=False, to='zinc.zone')),
+                ('queued_at', models.DateTimeField()),
+                ('next_attempt_at', models.DateTimeField(db_index=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'verbose_name_plural': 'dirty zones',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.10 on 2026-10-18 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zinc', '0012_dirtyzone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='policy',
+            name='tree_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
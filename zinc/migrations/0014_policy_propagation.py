@@ -0,0 +1,23 @@
+# Generated by Django 4.1.10 on 2026-10-18 02:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zinc', '0013_policy_tree_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='policy',
+            name='propagation_finished_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='policy',
+            name='propagation_started_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
@@ -3,15 +3,17 @@ import collections.abc
 import contextlib
 import json
 import uuid
+from datetime import timedelta
 from logging import getLogger
 
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.utils import timezone
 
 from zinc import ns_check, route53, tasks
 from zinc.route53 import HealthCheck, get_local_aws_region_choices
-from zinc.route53.record import RECORD_PREFIX
+from zinc.route53.record import RECORD_PREFIX, ZINC_CUSTOM_RECORD_TYPES
 from zinc.validators import validate_domain, validate_hostname, validate_policy_name
 
 
@@ -36,9 +38,18 @@ class IP(models.Model):
     healthcheck_caller_reference = models.UUIDField(null=True, blank=True)
     deleted = models.BooleanField(default=False)
 
+    # fields that end up in the records of the policy trees
+    tree_fields = set(['enabled', 'healthcheck_id'])
+
     class Meta:
         verbose_name = 'IP'
 
+    def save(self, *args, **kwargs):
+        super(IP, self).save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or self.tree_fields & set(update_fields):
+            Policy.bump_tree_version(Policy.objects.filter(members__ip=self))
+
     def mark_policy_records_dirty(self):
         # sadly this breaks sqlite
         # policies = [
@@ -72,6 +83,11 @@ class Policy(models.Model):
         max_length=255, choices=ROUTING_CHOICES.items(), default=ROUTING_CHOICES['latency'])
 
     ttl = models.PositiveIntegerField(default=30)
+    # bumped whenever the members or their IPs change, so cached trees can be told apart
+    tree_version = models.PositiveIntegerField(default=0, editable=False)
+    # when the last change started propagating to the zones, and when all of them got clean
+    propagation_started_at = models.DateTimeField(null=True, editable=False)
+    propagation_finished_at = models.DateTimeField(null=True, editable=False)
 
     dirty_trigger_fields = set(['name', 'ttl'])
 
@@ -93,7 +109,50 @@ class Policy(models.Model):
     # in a transaction in autocommit mode on innodb, but it's better to be explicit
     @transaction.atomic
     def mark_policy_records_dirty(self):
+        Policy.objects.filter(pk=self.pk).update(tree_version=F('tree_version') + 1,
+                                                 propagation_started_at=timezone.now(),
+                                                 propagation_finished_at=None)
         self.records.update(dirty=True)
+        DirtyZone.push(self.records.values_list('zone_id', flat=True))
+        # don't wait for the periodic reconcile_zones, push the zones to the workers right away
+        policy_id = str(self.pk)
+        transaction.on_commit(lambda: tasks.propagate_policy.delay(policy_id))
+
+    def propagation(self):
+        """Progress of propagating the last change of the policy to its zones"""
+        zones = self.records.aggregate(
+            total=Count('zone', distinct=True),
+            pending=Count('zone', distinct=True, filter=Q(dirty=True)),
+        )
+        started_at, finished_at = self.propagation_started_at, self.propagation_finished_at
+        duration = None
+        if started_at is not None and finished_at is not None:
+            duration = (finished_at - started_at).total_seconds()
+        return {
+            'zones': zones['total'],
+            'pending_zones': zones['pending'],
+            'started_at': started_at,
+            'finished_at': finished_at,
+            'duration': duration,
+        }
+
+    @classmethod
+    def finish_propagation(cls, policy_ids):
+        """Mark the policies of a reconciled zone propagated, when none of their zones is dirty"""
+        policies = cls.objects.filter(
+            pk__in=policy_ids,
+            propagation_started_at__isnull=False,
+            propagation_finished_at=None,
+        ).exclude(records__dirty=True)
+        now = timezone.now()
+        for policy in policies:
+            logger.info('Policy %s propagated to all zones in %.1fs', policy,
+                        (now - policy.propagation_started_at).total_seconds())
+        policies.update(propagation_finished_at=now)
+
+    @staticmethod
+    def bump_tree_version(policies):
+        policies.update(tree_version=F('tree_version') + 1)
 
     def clean(self):
         # validate name to start with unique characters in order to prevent the tree builder
@@ -141,6 +200,11 @@ def validate_json(value):
         raise ValidationError("Not valid json")
 
 
+def _matches(record, name=None, type=None):
+    return ((name is None or record.name.startswith(name)) and
+            (type is None or record.type == type))
+
+
 class Zone(models.Model):
     root = models.CharField(max_length=255, validators=[validate_domain])
     route53_id = models.CharField(max_length=32, unique=True, editable=False,
@@ -155,16 +219,28 @@ class Zone(models.Model):
 
     def __init__(self, *args, **kwargs):
         self._route53_instance = None
+        self._policy_records = None
         super(Zone, self).__init__(*args, **kwargs)
 
     @property
     def dirty(self):
+        # set by with_dirty_flag, saves a query per zone when listing zones
+        annotated = getattr(self, 'has_dirty_policy_records', None)
+        if annotated is not None:
+            return annotated
         dirty = False
         for policy_record in self.policy_records.all():
             dirty |= policy_record.dirty
 
         return dirty
 
+    @classmethod
+    def with_dirty_flag(cls, queryset=None):
+        if queryset is None:
+            queryset = cls.objects.all()
+        return queryset.annotate(has_dirty_policy_records=Exists(
+            PolicyRecord.objects.filter(zone=OuterRef('pk'), dirty=True)))
+
     def clean(self):
         # if the root is not a fqdn then add the dot at the end
         # this will be called from admin
@@ -182,8 +258,9 @@ class Zone(models.Model):
         self.r53_zone.commit()
 
     def delete_record_by_hash(self, record_hash):
-        records = self.r53_zone.records()
-        to_delete_record = records[record_hash]
+        to_delete_record = self.r53_zone.get_record(record_hash)
+        if to_delete_record is None:
+            raise KeyError(record_hash)
         to_delete_record.deleted = True
         self.r53_zone.process_records([to_delete_record])
 
@@ -192,11 +269,26 @@ class Zone(models.Model):
 
     def get_policy_records(self):
         # return a list with Policy records
-        records = []
-        for policy_record in self.policy_records.all():
-            records.append(policy_record.serialize())
-
-        return records
+        return list(self._policy_records_by_name()[0])
+
+    def _policy_records_by_name(self):
+        """
+        The zone's policy records, serialized, and the set of their names. They are fetched with
+        their policies in one query and kept by this instance, so for the rest of the request,
+        until one of the zone's PolicyRecords is saved or deleted.
+        """
+        if self._policy_records is None:
+            policy_records = self.policy_records.all()
+            if 'policy_records' not in getattr(self, '_prefetched_objects_cache', {}):
+                policy_records = policy_records.select_related('policy')
+            records = [policy_record.serialize() for policy_record in policy_records]
+            self._policy_records = (records, set(record.name for record in records))
+        return self._policy_records
+
+    def forget_policy_records(self):
+        """Drop the policy records kept by `_policy_records_by_name`, and the prefetched ones"""
+        self._policy_records = None
+        getattr(self, '_prefetched_objects_cache', {}).pop('policy_records', None)
 
     @property
     def r53_zone(self):
@@ -207,26 +299,90 @@ class Zone(models.Model):
     def soft_delete(self):
         self.deleted = True
         self.save(update_fields=['deleted'])
+        DirtyZone.push([self.pk])
         tasks.aws_delete_zone.delay(self.pk)
 
     @property
     def records(self):
-        records = self.r53_zone.records()
-        filtered_records = []
-        policy_records = self.get_policy_records()
+        return list(self.iter_records())
+
+    def iter_records(self, name=None, type=None):
+        """
+        Yield the records of the zone, as they are decoded from Route53. Only the records
+        whose name starts with `name` and of `type` are kept, when given.
+        """
+        policy_records, policy_names = self._policy_records_by_name()
 
-        for record in records.values():
-            if record.is_hidden:
+        for record in self.r53_zone.iter_records():
+            if record.is_hidden or not _matches(record, name, type):
                 continue
-            if record.is_alias and any(((record.name == pr.name) for pr in policy_records)):
+            if record.is_alias and record.name in policy_names:
                 continue
-            filtered_records.append(record)
+            yield record
 
         # Add policy records.
         for record in policy_records:
-            filtered_records.append(record)
-
-        return filtered_records
+            if _matches(record, name, type):
+                yield record
+
+    def records_page(self, start=None, page_size=100, name=None, type=None):
+        """
+        One page of `records`, starting at a marker returned by the previous page, see
+        `route53.Zone.records_page`. Only records whose name starts with `name` and of `type`
+        are kept, when given. The policy records come first, by name and type; their markers
+        have the policy record types.
+        Returns the records and the marker of the next page, None on the last page.
+        """
+        policy_records, policy_names = self._policy_records_by_name()
+        records = []
+        if start is None or start[1] in ZINC_CUSTOM_RECORD_TYPES:
+            records = sorted((record for record in policy_records if _matches(record, name, type)),
+                             key=lambda record: (record.name, record.type))
+            if start is not None:
+                records = [record for record in records if (record.name, record.type) >= start[:2]]
+            if len(records) > page_size:
+                next_record = records[page_size]
+                return records[:page_size], (next_record.name, next_record.type, None)
+            # the zone's apex is the first record Route53 lists
+            start = (self.root, None, None)
+        while start is not None and len(records) < page_size:
+            page, next_start = self.r53_zone.records_page(start, max_items=page_size)
+            for record in page:
+                if len(records) == page_size:
+                    # the next page starts at the first record not looked at
+                    next_start = (record.to_aws()['Name'], record.type, record.set_identifier)
+                    break
+                if record.is_hidden or not _matches(record, name, type):
+                    continue
+                if record.is_alias and record.name in policy_names:
+                    continue
+                records.append(record)
+            start = next_start
+        return records, start
+
+    def record_name_index(self):
+        """
+        The `route53.record_name_index` of `records`, read from the zone's record index
+        without building the whole list.
+        """
+        policy_records, policy_names = self._policy_records_by_name()
+        records = [record for record in self.r53_zone.frozen_records()
+                   if not record.is_hidden and not (record.is_alias and record.name in policy_names)]
+        return route53.record_name_index(records + policy_records)
+
+    def get_record(self, record_id):
+        """Look up one of the records listed by `records`, without building the whole list"""
+        policy_records, policy_names = self._policy_records_by_name()
+        for record in policy_records:
+            if record.id == record_id:
+                # callers change the record they get, leave the kept one alone
+                return record.db_policy_record.serialize()
+        record = self.r53_zone.get_record(record_id)
+        if record is None or record.is_hidden:
+            return None
+        if record.is_alias and record.name in policy_names:
+            return None
+        return record
 
     def update_records(self, records):
         self.r53_zone.process_records(records)
@@ -236,7 +392,10 @@ class Zone(models.Model):
 
     @transaction.atomic
     def reconcile(self):
+        # reconciling a deleted zone deletes it, take its policies first
+        policy_ids = list(self.policy_records.values_list('policy_id', flat=True))
         self.r53_zone.reconcile()
+        Policy.finish_propagation(policy_ids)
 
     @contextlib.contextmanager
     @transaction.atomic
@@ -259,20 +418,21 @@ class Zone(models.Model):
                     self.delete_record(record)
 
     @classmethod
-    def update_ns_propagated(cls, delay=0):
-        resolver = ns_check.get_resolver()
+    def update_ns_propagated(cls):
         # the order matters because we want unpropagated zones to be checked first
         # to minimize the delay in tarnsitioning to propagated state
-        for zone in cls.objects.order_by('ns_propagated').all():
-            try:
-                zone.ns_propagated = ns_check.is_ns_propagated(
-                    zone, resolver=resolver, delay=delay)
-            except ns_check.CouldNotResolve:
-                logger.warn('Failed to resolve nameservers for %s', zone.root)
-            else:
-                if not zone.ns_propagated:
-                    logger.info('ns_propagated %-5s %s', zone.ns_propagated, zone.root)
-                zone.save()
+        zones = list(cls.objects.order_by('ns_propagated'))
+        resolved = ns_check.resolve_name_servers([zone.root for zone in zones])
+        to_update = []
+        for zone, name_servers in zip(zones, resolved):
+            if isinstance(name_servers, ns_check.CouldNotResolve):
+                logger.warning('Failed to resolve nameservers for %s', zone.root)
+                continue
+            zone.ns_propagated = ns_check.check_name_servers(zone, name_servers)
+            if not zone.ns_propagated:
+                logger.info('ns_propagated %-5s %s', zone.ns_propagated, zone.root)
+            to_update.append(zone)
+        cls.objects.bulk_update(to_update, ['ns_propagated', 'cached_ns_records'], batch_size=500)
 
     @classmethod
     def _dirty_query(cls):
@@ -282,7 +442,7 @@ class Zone(models.Model):
     def need_reconciliation(cls):
         return cls.objects.filter(
             cls._dirty_query()
-        )
+        ).distinct()
 
     @classmethod
     def get_clean_zones(cls):
@@ -314,6 +474,22 @@ class PolicyRecord(models.Model):
     def __str__(self):
         return '{}.{}'.format(self.name, self.zone.root)
 
+    def save(self, *args, **kwargs):
+        rv = super().save(*args, **kwargs)
+        self._forget_zone_policy_records()
+        if self.dirty:
+            DirtyZone.push([self.zone_id])
+        return rv
+
+    def delete(self, *args, **kwargs):
+        rv = super().delete(*args, **kwargs)
+        self._forget_zone_policy_records()
+        return rv
+
+    def _forget_zone_policy_records(self):
+        if PolicyRecord.zone.is_cached(self):
+            self.zone.forget_policy_records()
+
     def serialize(self):
         assert self.zone is not None
         record = route53.PolicyRecord(policy_record=self, zone=self.zone.r53_zone)
@@ -332,11 +508,10 @@ class PolicyRecord(models.Model):
         self.save(update_fields=['dirty'])
 
     def clean(self):
-        zone_records = self.zone.r53_zone.records()
         # guard against PolicyRecords/CNAME name clashes
         if not self.deleted:
             # don't do the check unless the PR is deleted
-            for record in zone_records.values():
+            for record in self.zone.r53_zone.iter_records():
                 if record.name == self.name and record.type == 'CNAME':
                     raise ValidationError(
                         {'name': "A CNAME record of the same name already exists."})
@@ -377,3 +552,68 @@ class PolicyRecord(models.Model):
             return model
         except cls.DoesNotExist:
             return cls(name=name, record_type=record_type, zone=zone)
+
+
+class DirtyZone(models.Model):
+    """
+    Work queue of the zones waiting to be reconciled. A zone is queued at most once; queueing it
+    again while it's being reconciled makes sure it gets another pass. Failed zones are retried
+    with an exponential backoff.
+    """
+    zone = models.OneToOneField(Zone, primary_key=True, on_delete=models.CASCADE,
+                                related_name='dirty_entry')
+    queued_at = models.DateTimeField()
+    next_attempt_at = models.DateTimeField(db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    retry_delay = timedelta(seconds=10)
+    max_retry_delay = timedelta(hours=1)
+
+    class Meta:
+        verbose_name_plural = 'dirty zones'
+
+    def __str__(self):
+        return '{} ({} attempts)'.format(self.zone_id, self.attempts)
+
+    @classmethod
+    def push(cls, zone_ids, requeue=True):
+        """
+        Queue the zones for reconciliation. Zones already queued are due right away, unless
+        requeue is False, which leaves them (and their retry backoff) alone.
+        """
+        now = timezone.now()
+        zone_ids = set(zone_ids)
+        if not zone_ids:
+            return
+        if requeue:
+            # not bulk_create(update_conflicts=True), MySQL can't tell it the conflicting field
+            cls.objects.filter(zone_id__in=zone_ids).update(queued_at=now, next_attempt_at=now)
+        cls.objects.bulk_create([cls(zone_id=zone_id, queued_at=now, next_attempt_at=now)
+                                 for zone_id in zone_ids], ignore_conflicts=True)
+
+    @classmethod
+    def due(cls):
+        return cls.objects.filter(next_attempt_at__lte=timezone.now()).order_by('next_attempt_at')
+
+    def _pending(self):
+        # match on queued_at, so we don't touch the entry if it got queued again meanwhile
+        return DirtyZone.objects.filter(zone_id=self.zone_id, queued_at=self.queued_at)
+
+    def done(self):
+        self._pending().delete()
+
+    def failed(self, error):
+        delay = min(self.retry_delay * 2 ** self.attempts, self.max_retry_delay)
+        self._pending().update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=timezone.now() + delay,
+            last_error=error,
+        )
+
+    def complete(self, zone):
+        """Dequeue the zone after a reconcile pass, or retry it if it's still dirty"""
+        if Zone.need_reconciliation().filter(pk=zone.pk).exists():
+            self.failed("zone still needs reconciliation")
+        else:
+            self.done()
@@ -1,8 +1,10 @@
+import asyncio
 import json
 import time
 
 from django.conf import settings
 
+from dns.asyncresolver import Resolver as AsyncResolver
 from dns.resolver import Resolver
 from dns.exception import DNSException
 
@@ -17,24 +19,104 @@ def get_resolver():
     return resolver
 
 
-def is_ns_propagated(zone, resolver=None, delay=0):
+def get_async_resolvers():
+    """One resolver per configured name server, so each one gets its own rate limit"""
+    resolvers = []
+    for nameserver in settings.ZINC_NS_CHECK_RESOLVERS:
+        resolver = AsyncResolver(configure=False)
+        resolver.nameservers = [nameserver]
+        resolvers.append(resolver)
+    return resolvers
+
+
+def check_name_servers(zone, name_servers):
+    """
+    Compare the resolved name servers with the zone's Route53 name servers, looking them up
+    as cheaply as possible: the cached NS records, then the zone's delegation set, and only
+    listing the zone's records when neither one can settle it.
+    Updates zone.cached_ns_records, without saving it, when it had to be refreshed.
+    """
+    cached_name_servers = json.loads(zone.cached_ns_records) if zone.cached_ns_records else None
+    if cached_name_servers == name_servers:
+        return True
+    delegation_name_servers = zone.r53_zone.get_delegation_name_servers()
+    if delegation_name_servers is not None and (
+            delegation_name_servers in (name_servers, cached_name_servers)):
+        zone.cached_ns_records = json.dumps(delegation_name_servers)
+        return delegation_name_servers == name_servers
+    # in case the nameservers don't match we update the cached_ns_records from the
+    # zone's NS record and compare again
     if not zone.r53_zone.exists:
         return False
+    r53_name_servers = sorted(zone.r53_zone.ns.values)
+    zone.cached_ns_records = json.dumps(r53_name_servers)
+    return r53_name_servers == name_servers
+
+
+def is_ns_propagated(zone, resolver=None, delay=0):
+    if not zone.route53_id:
+        return False
     if resolver is None:
         resolver = get_resolver()
     try:
         name_servers = sorted([str(ns) for ns in resolver.query(zone.root, 'NS')])
     except DNSException as e:
         raise CouldNotResolve(e)
-    if zone.cached_ns_records:
-        r53_name_servers = json.loads(zone.cached_ns_records)
-        if delay:
-            time.sleep(delay)
-        if r53_name_servers == name_servers:
-            return True
-    # in case the nameservers don't match we update the cached_ns_records and
-    # compare again
-    r53_name_servers = sorted(zone.r53_zone.ns.values)
-    zone.cached_ns_records = json.dumps(r53_name_servers)
-    zone.save(update_fields=['cached_ns_records'])
-    return r53_name_servers == name_servers
+    if zone.cached_ns_records and delay:
+        time.sleep(delay)
+    cached_ns_records = zone.cached_ns_records
+    propagated = check_name_servers(zone, name_servers)
+    if zone.cached_ns_records != cached_ns_records:
+        zone.save(update_fields=['cached_ns_records'])
+    return propagated
+
+
+class RateLimiter:
+    """Spaces out the queries sent to a resolver to at most `rate` per second"""
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next_at = 0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def _resolve_name_servers(roots, resolvers, concurrency, rate):
+    semaphore = asyncio.Semaphore(concurrency)
+    limiters = [RateLimiter(rate) for _ in resolvers]
+
+    async def resolve(index, root):
+        # spread the zones over the resolvers
+        resolver = resolvers[index % len(resolvers)]
+        limiter = limiters[index % len(resolvers)]
+        async with semaphore:
+            await limiter.wait()
+            try:
+                answer = await resolver.resolve(root, 'NS')
+            except DNSException as e:
+                return CouldNotResolve(e)
+        return sorted([str(ns) for ns in answer])
+
+    return await asyncio.gather(*[resolve(index, root) for index, root in enumerate(roots)])
+
+
+def resolve_name_servers(roots, resolvers=None, concurrency=None, rate=None):
+    """
+    Resolve the NS records of all roots concurrently.
+    Returns, in the order of roots, the sorted name servers or a CouldNotResolve instance.
+    """
+    if resolvers is None:
+        resolvers = get_async_resolvers()
+    if concurrency is None:
+        concurrency = getattr(settings, 'ZINC_NS_CHECK_CONCURRENCY', 50)
+    if rate is None:
+        rate = getattr(settings, 'ZINC_NS_CHECK_RATE', 100)
+    if not roots:
+        return []
+    return asyncio.run(_resolve_name_servers(roots, resolvers, concurrency, rate))
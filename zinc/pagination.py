@@ -12,12 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import base64
+import binascii
+import json
 
+from rest_framework.exceptions import NotFound
 from rest_framework.settings import api_settings
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, _positive_int
 from rest_framework.response import Response
 from rest_framework.utils.urls import replace_query_param, remove_query_param
 
+from zinc.route53.record import ROUTE53_RECORD_TYPES, ZINC_CUSTOM_RECORD_TYPES
+
 
 class LinkHeaderPagination(PageNumberPagination):
     page_size = api_settings.PAGE_SIZE or 30
@@ -62,3 +68,68 @@ class LinkHeaderPagination(PageNumberPagination):
         headers = {'Link': link} if link else {}
 
         return Response(data, headers=headers)
+
+
+class RecordCursorPagination:
+    """
+    Pages through the records of a zone without listing all of them, see `Zone.records_page`.
+    The cursor wraps the Route53 marker of the next record, so there's no count of the records
+    and the pages only link to the next one.
+    """
+    page_size = 100
+    # the most records Route53 lists at once
+    max_page_size = 300
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_records(self, zone, request, **filters):
+        self.request = request
+        records, self.next_start = zone.records_page(
+            start=self.decode_cursor(request), page_size=self.get_page_size(request), **filters)
+        return records
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param],
+                                 strict=True, cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            name, type_, set_identifier = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (binascii.Error, UnicodeError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        # the markers go to Route53 as they are, only take the ones it accepts
+        if not isinstance(name, str) or not name:
+            raise NotFound(self.invalid_cursor_message)
+        # policy record types mark the pages of policy records, see `Zone.records_page`
+        if type_ is not None and type_ not in ROUTE53_RECORD_TYPES and \
+                type_ not in ZINC_CUSTOM_RECORD_TYPES:
+            raise NotFound(self.invalid_cursor_message)
+        if set_identifier is not None and (type_ is None or not isinstance(set_identifier, str)):
+            raise NotFound(self.invalid_cursor_message)
+        return (name, type_, set_identifier)
+
+    def encode_cursor(self, start):
+        return base64.urlsafe_b64encode(json.dumps(list(start)).encode('utf-8')).decode('ascii')
+
+    def get_next_link(self):
+        if self.next_start is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_start))
+
+    def get_paginated_response(self, data):
+        next_url = self.get_next_link()
+        headers = {'Link': '<{}>; rel="next"'.format(next_url)} if next_url else {}
+        return Response(data, headers=headers)
@@ -0,0 +1,25 @@
+from django.http import StreamingHttpResponse
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+
+def render_json_list(items):
+    """Render the items as a JSON list, one item at a time, the way JSONRenderer would"""
+    separators = (',', ':') if api_settings.COMPACT_JSON else (', ', ': ')
+    encoder = encoders.JSONEncoder(ensure_ascii=not api_settings.UNICODE_JSON,
+                                   separators=separators)
+    yield b'['
+    for position, item in enumerate(items):
+        if position:
+            yield separators[0].encode()
+        yield encoder.encode(item).encode()
+    yield b']'
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """Sends a list of items as soon as each of them is ready, instead of rendering them at once"""
+
+    def __init__(self, items, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(render_json_list(items), **kwargs)
+
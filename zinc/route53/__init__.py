@@ -1,6 +1,7 @@
 from boto3.session import Session
 
-from .record import Record, PolicyRecord, record_factory  # noqa: F401
+from .record import (Record, PolicyRecord, record_factory,  # noqa: F401
+                     record_name_index, update_record_name_index, full_clean_records)
 from .policy import Policy  # noqa: F401
 from .zone import Zone  # noqa: F401
 from .health_check import HealthCheck  # noqa: F401
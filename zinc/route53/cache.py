@@ -0,0 +1,129 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+logger = logging.getLogger(__name__)
+
+
+class RecordSetCache:
+    """
+    Process-external cache for the raw record sets of hosted zones, shared by every API
+    process and celery worker. Backed by the django cache named by ZINC_RECORDS_CACHE.
+
+    Every zone has a version counter that is bumped after each change batch; a cached record
+    set is only served while it was stored for the current version, so a reader can never
+    pick up a record set that predates a commit made by another process.
+
+    The cache is an optimization only, so backend errors are logged and treated as misses.
+    Every process counts its hits and misses, and logs them every stats_log_interval lookups.
+    """
+    key_prefix = 'route53:records'
+    stats_log_interval = 1000
+
+    def __init__(self, alias=None, timeout=None):
+        self._alias = alias
+        self._timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def alias(self):
+        return self._alias or getattr(settings, 'ZINC_RECORDS_CACHE', 'route53')
+
+    @property
+    def timeout(self):
+        if self._timeout is not None:
+            return self._timeout
+        return getattr(settings, 'ZINC_RECORDS_CACHE_TTL', 300)
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _key(self, zone_id):
+        return '{}:{}'.format(self.key_prefix, zone_id)
+
+    def _version_key(self, zone_id):
+        return '{}:{}:version'.format(self.key_prefix, zone_id)
+
+    def version(self, zone_id):
+        try:
+            return self.backend.get(self._version_key(zone_id), 0)
+        except Exception:
+            logger.exception("failed to read record set version for %s", zone_id)
+            return 0
+
+    def get(self, zone_id):
+        """
+        Returns a (records, version) tuple. records is None unless a record set stored for the
+        zone's current version is cached.
+        """
+        key, version_key = self._key(zone_id), self._version_key(zone_id)
+        try:
+            values = self.backend.get_many([key, version_key])
+        except Exception:
+            logger.exception("failed to read cached records for %s", zone_id)
+            values = {}
+        entry = values.get(key)
+        version = values.get(version_key, 0)
+        if entry is None or entry['version'] != version:
+            self._count(hit=False)
+            logger.debug("record cache miss for %s", zone_id)
+            return None, version
+        self._count(hit=True)
+        logger.debug("record cache hit for %s", zone_id)
+        return entry['records'], version
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if (self.hits + self.misses) % self.stats_log_interval == 0:
+            stats = self.stats
+            logger.info("record cache: %d hits, %d misses, %.1f%% hit ratio",
+                        stats['hits'], stats['misses'], stats['hit_ratio'] * 100)
+
+    def set(self, zone_id, records, version):
+        try:
+            self.backend.set(self._key(zone_id), {'version': version, 'records': records},
+                             timeout=self.timeout)
+        except Exception:
+            logger.exception("failed to cache records for %s", zone_id)
+
+    def bump(self, zone_id):
+        """
+        Advances the zone's version, marking every cached record set as stale.
+        Returns the new version or None if the backend couldn't do it.
+        """
+        version_key = self._version_key(zone_id)
+        try:
+            self.backend.add(version_key, 0, timeout=None)
+            return self.backend.incr(version_key)
+        except Exception:
+            logger.debug("failed to bump record set version for %s", zone_id)
+            return None
+
+    def delete(self, zone_id):
+        try:
+            self.backend.delete(self._key(zone_id))
+        except Exception:
+            logger.exception("failed to invalidate cached records for %s", zone_id)
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+
+record_cache = RecordSetCache()
@@ -4,6 +4,8 @@ import boto3
 import botocore.retryhandler
 from django.conf import settings
 
+from .rate_limit import get_rate_limiter
+
 
 def delay_exponential(base, *a, **kwa):
     """
@@ -37,6 +39,11 @@ _client = boto3.client(
     aws_secret_access_key=AWS_SECRET or '-',
 )
 
+# every process takes its route53 requests from the same, cluster wide, token bucket
+rate_limiter = get_rate_limiter()
+if rate_limiter is not None:
+    rate_limiter.register(_client)
+
 
 def get_client():
     return _client
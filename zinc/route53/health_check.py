@@ -8,15 +8,19 @@ from .client import get_client
 
 logger = logging.getLogger('zinc.route53')
 
+# below this many IPs, getting their health checks one by one beats listing all of them
+BULK_LOAD_MIN_IPS = getattr(settings, 'ZINC_HEALTH_CHECK_BULK_LOAD_MIN_IPS', 10)
+
 
 def generate_caller_ref():
     return 'zinc {}'.format(uuid.uuid4())
 
 
 class HealthCheck:
-    def __init__(self, ip):
+    def __init__(self, ip, aws_data=None, loaded=False):
         self.ip = ip
-        self._aws_data = None
+        self._aws_data = aws_data
+        self._loaded = loaded or aws_data is not None
         self._client = get_client()
 
     @property
@@ -30,8 +34,9 @@ class HealthCheck:
         return self._aws_data.get('Id')
 
     def _load(self):
-        if self._aws_data is not None:
+        if self._loaded:
             return
+        self._loaded = True
         if self.ip.healthcheck_id is not None:
             try:
                 health_check = self._client.get_health_check(HealthCheckId=self.ip.healthcheck_id)
@@ -93,8 +98,48 @@ class HealthCheck:
                 self.create()
 
     @classmethod
-    def reconcile_for_ips(cls, ips):
-        checks = [cls(ip) for ip in ips]
+    def _list_health_checks(cls, client):
+        paginator = client.get_paginator('list_health_checks')
+        health_checks = []
+        for page in paginator.paginate():
+            health_checks.extend(page['HealthChecks'])
+        return health_checks
+
+    @classmethod
+    def bulk_load(cls, ips):
+        """
+        Build the checks for all the ips from a single health check listing, instead of getting
+        each one from AWS. An ip that lost its healthcheck_id (eg. the worker died after
+        creating the health check) gets it back by matching the caller reference.
+        """
+        client = get_client()
+        health_checks = cls._list_health_checks(client)
+        by_id = {health_check['Id']: health_check for health_check in health_checks}
+        by_caller_reference = {
+            health_check['CallerReference']: health_check for health_check in health_checks}
+        checks = []
+        for ip in ips:
+            aws_data = by_id.get(ip.healthcheck_id)
+            if aws_data is None and ip.healthcheck_caller_reference is not None:
+                aws_data = by_caller_reference.get(str(ip.healthcheck_caller_reference))
+                if aws_data is not None:
+                    logger.info("%-15s recovered hc: %s", ip.ip, aws_data['Id'])
+                    ip.healthcheck_id = aws_data['Id']
+                    ip.save(update_fields=['healthcheck_id'])
+            checks.append(cls(ip, aws_data=aws_data, loaded=True))
+        return checks
+
+    @classmethod
+    def reconcile_for_ips(cls, ips, full=True):
+        """
+        Reconcile the health checks of the ips. Unless they are all the IPs (full), the health
+        checks are listed only for BULK_LOAD_MIN_IPS ips or more, and got one by one otherwise.
+        """
+        ips = list(ips)
+        if full or len(ips) >= BULK_LOAD_MIN_IPS:
+            checks = cls.bulk_load(ips)
+        else:
+            checks = [cls(ip) for ip in ips]
         for check in checks:
             try:
                 check.reconcile()
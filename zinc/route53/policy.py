@@ -1,16 +1,91 @@
-import copy
+import time
 from collections import OrderedDict
 
+from django.conf import settings
+
 import zinc.route53
+from zinc import models
 from zinc.utils import memoized_property
 from .record import Record, RECORD_PREFIX
 
 
+class TreeTemplates:
+    """Process wide cache of the policy trees, shared by all the zones using a policy
+
+    A template holds the records of a tree without the zone bits: alias targets are
+    relative to the zone root and records have no zone, so `Policy._stamp` can turn it into
+    the records of any zone. Templates are keyed by the policy's `tree_version`, which is
+    bumped whenever the members or their IPs change. The ttl bounds how stale a tree can get
+    if the tree changes in some way that doesn't bump the version.
+    """
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._templates = OrderedDict()
+
+    def get(self, key):
+        entry = self._templates.get(key)
+        if entry is None:
+            return None
+        expires, template = entry
+        if expires < time.monotonic():
+            del self._templates[key]
+            return None
+        self._templates.move_to_end(key)
+        return template
+
+    def set(self, key, template):
+        self._templates[key] = (time.monotonic() + self.ttl, template)
+        self._templates.move_to_end(key)
+        while len(self._templates) > self.max_size:
+            self._templates.popitem(last=False)
+
+    def clear(self):
+        self._templates.clear()
+
+
+tree_templates = TreeTemplates(
+    ttl=getattr(settings, 'ZINC_POLICY_TREE_CACHE_TTL', 60),
+    max_size=getattr(settings, 'ZINC_POLICY_TREE_CACHE_SIZE', 1024),
+)
+
+
 class Policy:
-    def __init__(self, zone, policy):
+    def __init__(self, zone, policy, members=None, cache_template=False):
         assert isinstance(zone, zinc.route53.Zone)
         self.zone = zone
         self.db_policy = policy
+        self._members = members
+        self._cache_template = cache_template
+
+    @staticmethod
+    def _active_members():
+        return models.PolicyMember.objects.exclude(enabled=False) \
+                                          .exclude(ip__enabled=False).select_related('ip')
+
+    @classmethod
+    def for_policies(cls, zone, policies):
+        """Build the Policy objects of many policies, loading all their members in one query
+
+        The trees are shared with the other zones through `tree_templates`, so the members
+        are only loaded for the policies that have no cached tree yet.
+        """
+        policies = [cls(zone=zone, policy=policy, cache_template=True) for policy in policies]
+        missing = {policy.id: policy for policy in policies
+                   if tree_templates.get(policy.template_key) is None}
+        if missing:
+            for policy in missing.values():
+                policy._members = []
+            for member in cls._active_members().filter(policy__in=missing.keys()):
+                missing[member.policy_id]._members.append(member)
+        return policies
+
+    @property
+    def members(self):
+        """The enabled members of the policy, with enabled IPs"""
+        if self._members is None:
+            self._members = list(self._active_members().filter(policy=self.db_policy))
+        return self._members
 
     @property
     def name(self):
@@ -26,10 +101,11 @@ class Policy:
 
     @memoized_property
     def aws_records(self):
-        """What we have in AWS"""
+        """What we have in AWS, dotted names are left to the zone's orphan sweep"""
         return dict([
-            (r_id, record) for (r_id, record) in self.zone.records().items()
-            if record.is_member_of(self)
+            (record.id, record) for record in
+            self.zone.records_with_prefix('{}_{}'.format(RECORD_PREFIX, self.name))
+            if '.' not in record.name
         ])
 
     @memoized_property
@@ -37,6 +113,23 @@ class Policy:
         """The records we should have (the desired state of the world)"""
         return OrderedDict([(record.id, record) for record in self._build_tree()])
 
+    @property
+    def template_key(self):
+        db_policy = self.db_policy
+        return (db_policy.id, db_policy.tree_version, db_policy.name, db_policy.ttl,
+                db_policy.routing)
+
+    @memoized_property
+    def template(self):
+        """The records of the tree, without the zone bits (see `TreeTemplates`)"""
+        if not self._cache_template:
+            return self._build_template()
+        template = tree_templates.get(self.template_key)
+        if template is None:
+            template = self._build_template()
+            tree_templates.set(self.template_key, template)
+        return template
+
     def _build_weighted_tree(self, policy_members, region_suffixed=True):
         # Build simple tree
         records = []
@@ -45,60 +138,56 @@ class Policy:
             if ':' in policy_member.ip.ip:
                 record_type = 'AAAA'
 
-            health_check_kwa = {}
+            record = {
+                'ttl': self.db_policy.ttl,
+                'type': record_type,
+                'values': (policy_member.ip.ip,),
+                'set_identifier': '{}-{}'.format(str(policy_member.id), policy_member.region),
+                'weight': policy_member.weight,
+            }
             if policy_member.ip.healthcheck_id:
-                health_check_kwa['health_check_id'] = str(policy_member.ip.healthcheck_id)
-            record = Record(
-                ttl=self.db_policy.ttl,
-                type=record_type,
-                values=[policy_member.ip.ip],
-                set_identifier='{}-{}'.format(str(policy_member.id), policy_member.region),
-                weight=policy_member.weight,
-                zone=self.zone,
-                **health_check_kwa,
-            )
-            # TODO: maybe we should have a specialized subclass for PolicyRecords
-            # and this logic should be moved there
+                record['health_check_id'] = str(policy_member.ip.healthcheck_id)
             if region_suffixed:
-                record.name = '{}_{}_{}'.format(RECORD_PREFIX, self.name, policy_member.region)
+                record['name'] = '{}_{}_{}'.format(RECORD_PREFIX, self.name, policy_member.region)
             else:
-                record.name = '{}_{}'.format(RECORD_PREFIX, self.name)
+                record['name'] = '{}_{}'.format(RECORD_PREFIX, self.name)
             records.append(record)
 
         return records
 
+    @staticmethod
+    def _group_members(policy_members):
+        """Map the regions of the members to the record types of their IPs, in one pass"""
+        regions = {}
+        for policy_member in policy_members:
+            record_type = 'AAAA' if ':' in policy_member.ip.ip else 'A'
+            regions.setdefault(policy_member.region, set()).add(record_type)
+        return regions
+
     def _build_lbr_tree(self, policy_members, regions):
         # Build latency based routed tree
         records = self._build_weighted_tree(policy_members)
-        for region in regions:
-            record = Record(
-                name='{}_{}'.format(RECORD_PREFIX, self.name),
-                type='A',
-                alias_target={
-                    'HostedZoneId': self.zone.id,
-                    'DNSName': '{}_{}_{}.{}'.format(
-                        RECORD_PREFIX, self.name, region, self.zone.root),
-                    'EvaluateTargetHealth': True  # len(regions) > 1
-                },
-                region=region,
-                set_identifier=region,
-                zone=self.zone,
-            )
-            if self._has_ipv4_records_in_region(policy_members, region):
+        for region in sorted(regions):
+            # the alias target is relative to the zone root, see `_stamp`
+            record = {
+                'name': '{}_{}'.format(RECORD_PREFIX, self.name),
+                'type': 'A',
+                'alias_target': '{}_{}_{}'.format(RECORD_PREFIX, self.name, region),
+                'region': region,
+                'set_identifier': region,
+            }
+            if 'A' in regions[region]:
                 records.append(record)
 
             # create a similar AAAA record if there exists IPv6 ips in this region.
-            if self._has_ipv6_records_in_region(policy_members, region):
-                record = copy.copy(record)
-                record.type = 'AAAA'
-                records.append(record)
+            if 'AAAA' in regions[region]:
+                records.append(dict(record, type='AAAA'))
 
         return records
 
-    def _build_tree(self):
-        policy_members = self.db_policy.members.exclude(enabled=False).exclude(ip__enabled=False)
-        # ensure we always build region subtrees in alphabetical order; makes tests simpler
-        regions = sorted(set([pm.region for pm in policy_members]))
+    def _build_template(self):
+        policy_members = self.members
+        regions = self._group_members(policy_members)
         if len(regions) == 0:
             raise Exception(
                 "Policy can't be applied for zone '{}'; "
@@ -108,6 +197,7 @@ class Policy:
             )
         if self.routing == 'latency':
             # Here is the case where are multiple regions
+            # region subtrees are built in alphabetical order; makes tests simpler
             records = self._build_lbr_tree(policy_members, regions=regions)
         # elif len(regions) == 1:
         elif self.routing == 'weighted':
@@ -117,7 +207,33 @@ class Policy:
         else:
             raise AssertionError('invalid routing {} for policy {}'.format(
                 self.routing, self.db_policy))
-        return records
+        return tuple(records)
+
+    def _stamp(self, record):
+        """Turn a template record into a Record of this zone"""
+        record = dict(record)
+        if 'values' in record:
+            record['values'] = list(record['values'])
+        if 'alias_target' in record:
+            record['alias_target'] = {
+                'HostedZoneId': self.zone.id,
+                'DNSName': '{}.{}'.format(record['alias_target'], self.zone.root),
+                'EvaluateTargetHealth': True  # len(regions) > 1
+            }
+        return Record(zone=self.zone, **record)
+
+    def _build_tree(self):
+        return [self._stamp(record) for record in self.template]
+
+    def _existing_records(self):
+        """
+        The records of aws_records to diff the tree against. When the zone's record set is
+        cached, those are its FrozenRecords, whose aws items are computed only once.
+        """
+        if not self.zone._has_cached_records():
+            return self.aws_records
+        return {rec_id: self.zone.get_frozen_record(rec_id) or record
+                for rec_id, record in self.aws_records.items()}
 
     def reconcile(self):
         aws_record_ids = self.aws_records.keys()
@@ -129,13 +245,14 @@ class Policy:
             to_delete.append(record)
         self.zone.process_records(to_delete)
         to_upsert = []
+        existing_records = self._existing_records()
         for rec_id, desired_record in self.desired_records.items():
-            existing_record = self.aws_records.get(rec_id)
+            existing_record = existing_records.get(rec_id)
             if existing_record is None:
                 to_upsert.append(desired_record)
             else:
                 # if desired is a subset of existing
-                if not desired_record.to_aws().items() <= existing_record.to_aws().items():
+                if not desired_record.is_subset(existing_record):
                     to_upsert.append(desired_record)
         self.zone.process_records(to_upsert)
 
@@ -144,25 +261,3 @@ class Policy:
         for record in records:
             record.deleted = True
         self.zone.process_records(records)
-
-    def _has_ipv6_records_in_region(self, policy_members, region):
-        has_ipv6 = False
-        for pm in policy_members:
-            if region and pm.region != region:
-                continue
-
-            if ':' in pm.ip.ip:
-                has_ipv6 = True
-
-        return has_ipv6
-
-    def _has_ipv4_records_in_region(self, policy_members, region):
-        has_ipv4 = False
-        for pm in policy_members:
-            if region and pm.region != region:
-                continue
-
-            if '.' in pm.ip.ip:
-                has_ipv4 = True
-
-        return has_ipv4
@@ -0,0 +1,143 @@
+"""
+Cluster wide rate limiting for the Route53 API.
+
+Route53 allows 5 requests per second for the whole AWS account, so the API processes and every
+celery worker take their requests from a single token bucket kept in redis. Each request runs
+with a priority; lower priorities leave some tokens in the bucket, so interactive API calls
+still get through while background sweeps are draining it.
+"""
+import contextlib
+import contextvars
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+RECONCILE = 'reconcile'
+BACKGROUND = 'background'
+
+# tokens a request of the given priority must leave in the bucket
+DEFAULT_RESERVED_TOKENS = {
+    INTERACTIVE: 0,
+    RECONCILE: 1,
+    BACKGROUND: 2,
+}
+
+_priority = contextvars.ContextVar('route53_priority', default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def priority(level):
+    """Run the Route53 requests made inside the block with the given priority"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+# Refill the bucket for the time passed since the last request, then take a token if more
+# than `reserve` would be left. Returns 0 on success, or the seconds to wait before retrying.
+# Numbers are returned as strings because redis truncates lua numbers to integers.
+_TAKE_TOKEN = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 + reserve then
+    tokens = tokens - 1
+else
+    wait = (1 + reserve - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    def __init__(self, redis_client, key, rate, capacity):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self._take_token = redis_client.register_script(_TAKE_TOKEN)
+
+    def try_acquire(self, reserve=0):
+        """Returns 0 if a token was taken, else the seconds to wait before trying again"""
+        return float(self._take_token(keys=[self.key], args=[self.rate, self.capacity, reserve]))
+
+
+class RateLimiter:
+    """
+    Blocks Route53 requests until the shared bucket has a token for them. If redis can't be
+    reached, or the wait gets longer than max_wait, the request is let through and botocore's
+    retries deal with the throttling.
+    """
+    def __init__(self, url, rate, capacity, reserved_tokens=None, max_wait=30,
+                 key='route53:rate_limit'):
+        self.url = url
+        self.rate = rate
+        self.capacity = capacity
+        self.reserved_tokens = reserved_tokens or DEFAULT_RESERVED_TOKENS
+        self.max_wait = max_wait
+        self.key = key
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            self._bucket = TokenBucket(redis.from_url(self.url), self.key,
+                                       rate=self.rate, capacity=self.capacity)
+        return self._bucket
+
+    def acquire(self, level=None):
+        level = level or current_priority()
+        reserve = self.reserved_tokens.get(level, 0)
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            try:
+                wait = self.bucket.try_acquire(reserve=reserve)
+            except redis.RedisError:
+                logger.exception("route53 rate limiter unavailable")
+                return
+            if not wait:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning("gave up waiting for a route53 request token (%s)", level)
+                return
+            time.sleep(min(wait, remaining))
+
+    def before_send(self, **kwargs):
+        """botocore before-send handler, runs for every HTTP request including retries"""
+        self.acquire()
+
+    def register(self, client):
+        client.meta.events.register('before-send.route53', self.before_send)
+
+
+def get_rate_limiter():
+    rate = getattr(settings, 'ZINC_ROUTE53_RATE_LIMIT', 0)
+    if not rate:
+        return None
+    return RateLimiter(
+        url=getattr(settings, 'ZINC_ROUTE53_RATE_LIMIT_URL', settings.LOCK_SERVER_URL),
+        rate=rate,
+        capacity=getattr(settings, 'ZINC_ROUTE53_RATE_LIMIT_BURST', rate),
+        reserved_tokens=getattr(settings, 'ZINC_ROUTE53_RESERVED_TOKENS', None),
+    )
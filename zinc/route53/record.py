@@ -1,5 +1,7 @@
 import json
 import hashlib
+from functools import lru_cache
+from types import MappingProxyType
 
 from hashids import Hashids
 from django.conf import settings
@@ -16,6 +18,8 @@ HASHIDS_ALPHABET = getattr(settings, 'HASHIDS_ALPHABET',
                            'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXY1234567890')
 hashids = Hashids(salt=HASHIDS_SALT,
                   alphabet=HASHIDS_ALPHABET)
+# how many record (and zone) ids to remember, ids are about 40 bytes each
+RECORD_ID_CACHE_SIZE = getattr(settings, 'ZINC_RECORD_ID_CACHE_SIZE', 65536)
 
 RECORD_PREFIX = '_zn'
 
@@ -36,6 +40,12 @@ RECORD_TYPES = [
     'SPF', 'SRV', 'NS', 'CAA',
 ] + ZINC_CUSTOM_RECORD_TYPES
 
+# the types of the record sets Route53 can list, including the ones zinc doesn't manage
+ROUTE53_RECORD_TYPES = frozenset([
+    'A', 'AAAA', 'CAA', 'CNAME', 'DS', 'HTTPS', 'MX', 'NAPTR', 'NS', 'PTR', 'SOA', 'SPF', 'SRV',
+    'SSHFP', 'SVCB', 'TLSA', 'TXT',
+])
+
 ALLOWED_RECORD_TYPES = set(RECORD_TYPES)
 ALLOWED_RECORD_TYPES.remove('SOA')
 
@@ -52,13 +62,32 @@ def get_record_type(rtype):
         return ZINC_RECORD_TYPES_MAP_REV[rtype]
 
 
+@lru_cache(maxsize=RECORD_ID_CACHE_SIZE, typed=True)
 def _encode(*args):
     _set_id = ':'.join([str(arg) for arg in args])
     _set_id = int(hashlib.sha256(_set_id.encode('utf-8')).hexdigest()[:16], base=16)
     return hashids.encode(_set_id)
 
 
-class BaseRecord:
+@lru_cache(maxsize=RECORD_ID_CACHE_SIZE, typed=True)
+def _record_id(zone_hash, name, type_, set_identifier):
+    return 'Z{zone}Z{type}Z{id}'.format(
+        zone=zone_hash, type=get_record_type(type_), id=_encode(name, type_, set_identifier))
+
+
+def _freeze(value):
+    """A hashable copy of a record set value: dicts become frozensets of items, lists tuples"""
+    if isinstance(value, dict):
+        return frozenset((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class RecordFormat:
+    """How records map to Route53 record sets, shared by BaseRecord and FrozenRecord"""
+    __slots__ = ()
+
     _obj_to_r53 = dict([
         ('name', 'Name'),
         ('type', 'Type'),
@@ -74,6 +103,83 @@ class BaseRecord:
     ])
     _r53_to_obj = {v: k for k, v in _obj_to_r53.items()}
 
+    @staticmethod
+    def _strip_root(name, root):
+        return '@' if name == root else name.replace('.' + root, '')
+
+    @staticmethod
+    def _add_root(name, root):
+        return root if name == '@' else '{}.{}'.format(name, root)
+
+    @classmethod
+    def unpack_txt_value(cls, value):
+        if value.startswith('"') and value.endswith('"'):
+            value = value[1:-1]
+
+        return ''.join(json.loads('"%s"' % chunk) for chunk in value.split('" "'))
+
+    @classmethod
+    def pack_txt_value(cls, value):
+        max_length = 255
+
+        if len(value) < max_length:
+            value = json.dumps(value)
+        else:
+            value = ' '.join('{}'.format(json.dumps(element))
+                             for element in chunks(value, max_length))
+
+        return {'Value': value}
+
+    def to_aws(self):
+        encoded_record = {
+            'Name': self._add_root(self.name, self.zone_root),
+            'Type': self.type,
+        }
+        if not self.is_alias:
+            if self.type == 'TXT':
+                # Encode json escape.
+                encoded_record['ResourceRecords'] = [self.pack_txt_value(value)
+                                                     for value in self.values]
+            else:
+                encoded_record['ResourceRecords'] = [{'Value': value} for value in self.values]
+        else:
+            encoded_record['AliasTarget'] = {
+                'DNSName': self.alias_target['DNSName'],
+                'EvaluateTargetHealth': self.alias_target['EvaluateTargetHealth'],
+                'HostedZoneId': self.alias_target['HostedZoneId'],
+            }
+        if self.ttl is not None:
+            encoded_record['TTL'] = self.ttl
+
+        for attr_name in ['Weight', 'Region', 'SetIdentifier',
+                          'HealthCheckId', 'TrafficPolicyInstanceId']:
+            value = getattr(self, self._r53_to_obj[attr_name])
+            if value is not None:
+                encoded_record[attr_name] = value
+
+        return encoded_record
+
+    @property
+    def aws_items(self):
+        """The items of to_aws(), hashable, so comparing records is a set operation"""
+        return _freeze(self.to_aws())
+
+    @property
+    def is_alias(self):
+        return self.alias_target is not None
+
+    @property
+    def is_hidden(self):
+        return self.name.startswith(RECORD_PREFIX)
+
+    def is_member_of(self, policy):
+        return self.name.startswith('{}_{}'.format(RECORD_PREFIX, policy.name))
+
+    def is_subset(self, other):
+        return self.aws_items <= other.aws_items
+
+
+class BaseRecord(RecordFormat):
     def __init__(self, name=None, alias_target=None, created=False, deleted=False, dirty=False,
                  health_check_id=None, managed=False, region=None, set_identifier=None,
                  traffic_policy_instance_id=None, ttl=None, values=None, weight=None,
@@ -97,6 +203,7 @@ class BaseRecord:
         self.deleted = deleted
         self.dirty = dirty
         self.managed = managed
+        self._id = None
 
     def __repr__(self):
         return "<{} id={} {}:{} {}>".format(
@@ -115,21 +222,6 @@ class BaseRecord:
         assert not self.is_alias
         self._values = value
 
-    @staticmethod
-    def _strip_root(name, root):
-        return '@' if name == root else name.replace('.' + root, '')
-
-    @staticmethod
-    def _add_root(name, root):
-        return root if name == '@' else '{}.{}'.format(name, root)
-
-    @classmethod
-    def unpack_txt_value(cls, value):
-        if value.startswith('"') and value.endswith('"'):
-            value = value[1:-1]
-
-        return ''.join(json.loads('"%s"' % chunk) for chunk in value.split('" "'))
-
     @classmethod
     def from_aws_record(cls, record, zone):
         # Determine if a R53 DNS record is of type ALIAS
@@ -169,83 +261,34 @@ class BaseRecord:
 
     @property
     def id(self):
-        zone_hash = _encode(self.zone_id)
-        record_hash = _encode(self.name, self.type, self.set_identifier)
-        return 'Z{zone}Z{type}Z{id}'.format(
-            zone=zone_hash, type=get_record_type(self.type), id=record_hash)
-
-    @classmethod
-    def pack_txt_value(cls, value):
-        max_length = 255
-
-        if len(value) < max_length:
-            value = json.dumps(value)
-        else:
-            value = ' '.join('{}'.format(json.dumps(element))
-                             for element in chunks(value, max_length))
-
-        return {'Value': value}
-
-    def to_aws(self):
-        encoded_record = {
-            'Name': self._add_root(self.name, self.zone_root),
-            'Type': self.type,
-        }
-        if not self.is_alias:
-            if self.type == 'TXT':
-                # Encode json escape.
-                encoded_record['ResourceRecords'] = [self.pack_txt_value(value)
-                                                     for value in self.values]
-            else:
-                encoded_record['ResourceRecords'] = [{'Value': value} for value in self.values]
-        else:
-            encoded_record['AliasTarget'] = {
-                'DNSName': self.alias_target['DNSName'],
-                'EvaluateTargetHealth': self.alias_target['EvaluateTargetHealth'],
-                'HostedZoneId': self.alias_target['HostedZoneId'],
-            }
-        if self.ttl is not None:
-            encoded_record['TTL'] = self.ttl
-
-        for attr_name in ['Weight', 'Region', 'SetIdentifier',
-                          'HealthCheckId', 'TrafficPolicyInstanceId']:
-            value = getattr(self, self._r53_to_obj[attr_name])
-            if value is not None:
-                encoded_record[attr_name] = value
-
-        return encoded_record
-
-    @property
-    def is_alias(self):
-        return self.alias_target is not None
-
-    @property
-    def is_hidden(self):
-        return self.name.startswith(RECORD_PREFIX)
-
-    def is_member_of(self, policy):
-        return self.name.startswith('{}_{}'.format(RECORD_PREFIX, policy.name))
+        # computed once, unless the fields it's made of change
+        key = (self.zone.hash, self.name, self.type, self.set_identifier)
+        if self._id is None or self._id[0] != key:
+            self._id = (key, _record_id(*key))
+        return self._id[1]
 
     def save(self):
         self.zone.process_records([self])
 
-    def is_subset(self, other):
-        return self.to_aws().items() <= other.to_aws().items()
-
-    def validate_unique(self):
-        """You're not allowed to have a CNAME clash with any other type of record"""
+    def validate_unique(self, index=None):
+        """
+        You're not allowed to have a CNAME clash with any other type of record.
+        `index` is the zone's record_name_index, built from the zone's records when not given.
+        """
         if self.deleted:
             # allow deleting any conflicting record
             return
+        if index is None:
+            index = self.zone.db_zone.record_name_index()
+        types = index.get(self.name, {})
         if self.type == 'CNAME':
-            clashing = tuple((self.name, r_type) for r_type in RECORD_TYPES)
+            clashing = RECORD_TYPES
         else:
-            clashing = ((self.name, 'CNAME'), )
-        for record in self.zone.db_zone.records:
-            for other in clashing:
-                if (record.name, record.type) == other and record.id != self.id:
-                    raise ValidationError(
-                        {'name': "A {} record of the same name already exists.".format(other[1])})
+            clashing = ('CNAME', )
+        for r_type in clashing:
+            if types.get(r_type, set()) - {self.id}:
+                raise ValidationError(
+                    {'name': "A {} record of the same name already exists.".format(r_type)})
 
     def clean(self):
         pass
@@ -253,10 +296,46 @@ class BaseRecord:
     def clean_fields(self):
         pass
 
-    def full_clean(self):
+    def full_clean(self, index=None):
         self.clean_fields()
         self.clean()
-        self.validate_unique()
+        self.validate_unique(index=index)
+
+
+def record_name_index(records):
+    """Index records by name, then type, to the ids of the records"""
+    index = {}
+    for record in records:
+        index.setdefault(record.name, {}).setdefault(record.type, set()).add(record.id)
+    return index
+
+
+def update_record_name_index(index, record):
+    """Apply a record change to a record_name_index"""
+    ids = index.setdefault(record.name, {}).setdefault(record.type, set())
+    if record.deleted:
+        ids.discard(record.id)
+    else:
+        ids.add(record.id)
+
+
+def full_clean_records(zone, records):
+    """
+    Validate a batch of records against the zone's records and each other, building the
+    zone's name index only once, from the record index the batch looks its records up in.
+    Returns the errors of each record, {} for the valid ones.
+    """
+    index = zone.db_zone.record_name_index()
+    errors = []
+    for record in records:
+        try:
+            record.full_clean(index=index)
+        except ValidationError as error:
+            errors.append(error.message_dict)
+        else:
+            errors.append({})
+        update_record_name_index(index, record)
+    return errors
 
 
 class Record(BaseRecord):
@@ -265,6 +344,62 @@ class Record(BaseRecord):
         self.type = type
 
 
+class FrozenRecord(RecordFormat):
+    """
+    An immutable, compact copy of a Record, without a reference to its zone, as kept for each
+    record of a zone's cached record set. Its aws_items and hash are computed once, so comparing
+    against it doesn't encode it again.
+    """
+    __slots__ = ('id', 'name', 'type', 'ttl', 'values', 'alias_target', 'weight', 'region',
+                 'set_identifier', 'health_check_id', 'traffic_policy_instance_id', 'managed',
+                 'zone_root', '_aws_items', '_hash')
+    _fields = __slots__[:-2]
+
+    def __init__(self, record):
+        for field in self._fields:
+            object.__setattr__(self, field, getattr(record, field))
+        # the values of aliases are made up from their target, keep the ones of the record set
+        values = record._values
+        object.__setattr__(self, 'values', tuple(values) if values is not None else None)
+        if self.alias_target is not None:
+            object.__setattr__(self, 'alias_target', MappingProxyType(dict(self.alias_target)))
+        object.__setattr__(self, '_aws_items', None)
+        object.__setattr__(self, '_hash', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is immutable".format(type(self).__name__))
+
+    def __repr__(self):
+        return "<{} id={} {}:{} {}>".format(
+            type(self).__name__, self.id, self.type, self.name, self.values)
+
+    def __eq__(self, other):
+        if not isinstance(other, FrozenRecord):
+            return NotImplemented
+        return hash(self) == hash(other) and self.aws_items == other.aws_items
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash(self.aws_items))
+        return self._hash
+
+    @property
+    def aws_items(self):
+        if self._aws_items is None:
+            object.__setattr__(self, '_aws_items', _freeze(self.to_aws()))
+        return self._aws_items
+
+    def to_record(self, zone):
+        """A Record of zone, for callers to change, flag for deletion or save"""
+        return Record(
+            zone=zone, name=self.name, type=self.type, ttl=self.ttl,
+            values=list(self.values) if self.values is not None else None,
+            alias_target=dict(self.alias_target) if self.alias_target is not None else None,
+            weight=self.weight, region=self.region, set_identifier=self.set_identifier,
+            health_check_id=self.health_check_id,
+            traffic_policy_instance_id=self.traffic_policy_instance_id, managed=self.managed)
+
+
 class PolicyRecord(BaseRecord):
     def __init__(self, zone, policy_record=None, policy=None, dirty=None,
                  deleted=None, created=None):
@@ -310,7 +445,7 @@ class PolicyRecord(BaseRecord):
     def reconcile(self):
         # upsert or delete the top level alias
         if self.deleted:
-            if self._top_level_record.id in self.zone.records():
+            if self._existing_alias is not None:
                 self.zone.process_records([self])
             self.db_policy_record.delete()
         else:
@@ -335,7 +470,7 @@ class PolicyRecord(BaseRecord):
 
     @memoized_property
     def _existing_alias(self):
-        return self.zone.records().get(self.id)
+        return self.zone.find_record(self._top_level_record)
 
     def to_aws(self):
         return self._top_level_record.to_aws()
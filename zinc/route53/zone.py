@@ -1,4 +1,7 @@
 from collections import OrderedDict
+import copy
+import itertools
+import re
 import uuid
 import logging
 
@@ -6,20 +9,169 @@ from botocore.exceptions import ClientError
 from django.db import transaction
 from django.conf import settings
 
-from .record import Record
+from .record import FrozenRecord, Record, RECORD_PREFIX, _encode
 from .policy import Policy
 from .client import get_client
+from .cache import record_cache
 
 
 logger = logging.getLogger(__name__)
 
+# route53 limits for a change_resource_record_sets request, UPSERTs count twice for the
+# number of ResourceRecord elements and for the length of their values
+MAX_CHANGES = 1000
+MAX_RESOURCE_RECORDS = 1000
+MAX_VALUES_LENGTH = 32000
+# the most records a list_resource_record_sets request returns
+MAX_LIST_ITEMS = 300
+
+_DNS_NAME_ESCAPE = re.compile(r'\\[0-7]{3}|[^a-z0-9_.-]')
+
+
+def _escape_dns_name(name):
+    """
+    Spell a DNS name the way Route53 returns it: lower cased, with every character other than
+    a-z, 0-9, '-', '_' and '.' as an octal escape code (eg. '*' becomes '\\052').
+    """
+    def escape(match):
+        char = match.group()
+        return char if len(char) > 1 else '\\{:03o}'.format(ord(char))
+    return _DNS_NAME_ESCAPE.sub(escape, name.lower())
+
+
+def _aws_record_key(aws_record):
+    return (aws_record['Name'], aws_record['Type'], aws_record.get('SetIdentifier'))
+
+
+def _aws_sort_key(aws_record):
+    """Route53 lists records by name with the labels reversed (com.example.www.), then type"""
+    name = '.'.join(reversed(aws_record['Name'].rstrip('.').split('.'))) + '.'
+    return (name, aws_record['Type'], aws_record.get('SetIdentifier') or '')
+
+
+def _start_record_kwargs(name, type_=None, set_identifier=None):
+    """The list_resource_record_sets arguments to start listing at a record"""
+    kwargs = {'StartRecordName': name}
+    if type_:
+        kwargs['StartRecordType'] = type_
+        if set_identifier:
+            kwargs['StartRecordIdentifier'] = set_identifier
+    return kwargs
+
+
+def _change_size(change):
+    """The number of ResourceRecord elements and value characters a change counts for"""
+    resource_records = change['ResourceRecordSet'].get('ResourceRecords', [])
+    weight = 2 if change['Action'] == 'UPSERT' else 1
+    return (weight * max(len(resource_records), 1),
+            weight * sum(len(record['Value']) for record in resource_records))
+
+
+def _alias_depths(changes):
+    """
+    How deep each change sits in the chains of aliases to records changed by the same batch,
+    0 for records that don't point to another record of the batch.
+    """
+    by_name = {}
+    for position, change in enumerate(changes):
+        name = _escape_dns_name(change['ResourceRecordSet']['Name'])
+        by_name.setdefault(name, []).append(position)
+    depths = {}
+
+    def depth(position, seen=()):
+        if position not in depths:
+            alias_target = changes[position]['ResourceRecordSet'].get('AliasTarget')
+            targets = []
+            if alias_target is not None:
+                target = _escape_dns_name(alias_target['DNSName'])
+                if not target.endswith('.'):
+                    target += '.'
+                targets = [other for other in by_name.get(target, [])
+                           if other not in seen and other != position]
+            depths[position] = 1 + max(
+                [depth(other, seen + (position, )) for other in targets], default=-1)
+        return depths[position]
+
+    return [depth(position) for position in range(len(changes))]
+
+
+def _order_changes(changes):
+    """
+    Order a change batch so it can be applied one change after the other: deletions of records
+    that are created again go first, then the changes creating records before the aliases
+    pointing to them, then the deletions of aliases before their targets. Every prefix of the
+    result leaves the aliases of the zone pointing to existing records.
+    """
+    created = set(_aws_record_key(change['ResourceRecordSet'])
+                  for change in changes if change['Action'] != 'DELETE')
+    deleted = [position for position, change in enumerate(changes)
+               if change['Action'] == 'DELETE']
+    others = [position for position, change in enumerate(changes)
+              if change['Action'] != 'DELETE']
+    delete_depths = dict(zip(deleted, _alias_depths([changes[i] for i in deleted])))
+    other_depths = dict(zip(others, _alias_depths([changes[i] for i in others])))
+
+    def order(position):
+        change = changes[position]
+        if change['Action'] != 'DELETE':
+            return (1, other_depths[position])
+        if _aws_record_key(change['ResourceRecordSet']) in created:
+            return (0, -delete_depths[position])
+        return (2, -delete_depths[position])
+
+    return [changes[position] for position in sorted(range(len(changes)), key=order)]
+
+
+def _split_changes(changes):
+    """
+    Split a change batch in batches route53 accepts. When it takes more than one request, the
+    changes are ordered by `_order_changes`, so every request leaves the aliases of the zone
+    pointing to existing records.
+    """
+    sizes = [_change_size(change) for change in changes]
+    if (len(changes) <= MAX_CHANGES and
+            sum(size[0] for size in sizes) <= MAX_RESOURCE_RECORDS and
+            sum(size[1] for size in sizes) <= MAX_VALUES_LENGTH):
+        return [list(changes)] if changes else []
+
+    batches = []
+    batch, batch_records, batch_length = [], 0, 0
+    for change in _order_changes(changes):
+        resource_records, length = _change_size(change)
+        if batch and (len(batch) >= MAX_CHANGES or
+                      batch_records + resource_records > MAX_RESOURCE_RECORDS or
+                      batch_length + length > MAX_VALUES_LENGTH):
+            batches.append(batch)
+            batch, batch_records, batch_length = [], 0, 0
+        batch.append(change)
+        batch_records += resource_records
+        batch_length += length
+    batches.append(batch)
+    return batches
+
+
+def _as_listed(aws_record):
+    """Turn a record we send in a change batch into the record Route53 will list"""
+    aws_record = copy.deepcopy(aws_record)
+    aws_record['Name'] = _escape_dns_name(aws_record['Name'])
+    alias_target = aws_record.get('AliasTarget')
+    if alias_target is not None:
+        dns_name = _escape_dns_name(alias_target['DNSName'])
+        if not dns_name.endswith('.'):
+            dns_name += '.'
+        alias_target['DNSName'] = dns_name
+    return aws_record
+
 
 class Zone(object):
 
     def __init__(self, db_zone):
         self.db_zone = db_zone
         self._aws_records = None
+        self._records_index = None
+        self._hash = None
         self._exists = None
+        self._version = 0
         self._change_batch = []
         self._client = get_client()
 
@@ -37,6 +189,18 @@ class Zone(object):
     def root(self):
         return self.db_zone.root
 
+    @property
+    def hash(self):
+        """The zone part of the record ids"""
+        if self._hash is None or self._hash[0] != self.id:
+            self._hash = (self.id, _encode(self.id))
+        return self._hash[1]
+
+    @property
+    def version(self):
+        """The version of the zone's record set we currently hold"""
+        return self._version
+
     def process_records(self, records):
         for record in records:
             self._add_record_changes(record)
@@ -58,68 +222,272 @@ class Zone(object):
     def _reset_change_batch(self):
         self._change_batch = []
 
-    def commit(self, preserve_cache=False):
-        if not preserve_cache:
-            self._clear_cache()
-        if not self._change_batch:
+    def commit(self):
+        """
+        Send the change batch to Route53, split in as many requests as its limits require.
+        When a request fails, the changes committed before it are dropped from the batch.
+        """
+        batches = _split_changes(self._change_batch)
+        while batches:
+            changes = batches[0]
+            try:
+                self._client.change_resource_record_sets(
+                    HostedZoneId=self.id,
+                    ChangeBatch={'Changes': changes}
+                )
+            except self._client.exceptions.InvalidChangeBatch:
+                # route53 rejects the batch as a whole, so the cached records are still accurate
+                logger.warning("failed to process batch %r", changes)
+                raise
+            except Exception:
+                self._clear_cache()
+                raise
+            self._apply_change_batch(changes)
+            batches.pop(0)
+            self._change_batch = [change for batch in batches for change in batch]
+
+    def _apply_change_batch(self, changes):
+        """
+        Apply a committed change batch to the cached records, instead of listing the whole zone
+        again, and publish the result under the zone's next version.
+        """
+        version = record_cache.bump(self.id)
+        if self._aws_records is None:
+            if version is None:
+                record_cache.delete(self.id)
             return
+        records = OrderedDict(
+            (_aws_record_key(aws_record), aws_record) for aws_record in self._aws_records)
+        for change in changes:
+            aws_record = _as_listed(change['ResourceRecordSet'])
+            if change['Action'] == 'DELETE':
+                records.pop(_aws_record_key(aws_record), None)
+            else:
+                records[_aws_record_key(aws_record)] = aws_record
+        self._aws_records = sorted(records.values(), key=_aws_sort_key)
+        if version is not None and version == self._version + 1:
+            record_cache.set(self.id, self._aws_records, version)
+        else:
+            # somebody else changed the zone since we listed it
+            record_cache.delete(self.id)
+        self._version = version if version is not None else self._version + 1
 
-        try:
-            self._client.change_resource_record_sets(
-                HostedZoneId=self.id,
-                ChangeBatch={'Changes': self._change_batch}
-            )
-        except self._client.exceptions.InvalidChangeBatch:
-            logger.warning("failed to process batch %r", self._change_batch)
-            raise
-        self._reset_change_batch()
+    def _record_index(self):
+        """
+        The zone's records by id, decoded once for the record set we hold, as FrozenRecords.
+        Any change to the record set replaces the _aws_records list, which rebuilds the index.
+        """
+        self._cache_aws_records()
+        aws_records = self._aws_records or []
+        if self._records_index is None or self._records_index[0] is not aws_records:
+            entries = OrderedDict()
+            for aws_record in aws_records:
+                record = Record.from_aws_record(aws_record, zone=self)
+                if record:
+                    entries[record.id] = FrozenRecord(record)
+            self._records_index = (aws_records, entries)
+        return self._records_index[1]
 
     def records(self):
-        self._cache_aws_records()
-        entries = OrderedDict()
-        for aws_record in self._aws_records or []:
+        return OrderedDict(
+            (record_id, record.to_record(self))
+            for record_id, record in self._record_index().items())
+
+    def iter_records(self):
+        """
+        Yield the zone's records. Unless the record set is cached, they are decoded as
+        Route53 lists them, without indexing them, so listing a big zone can start before all
+        of its pages come from Route53.
+        """
+        if self._has_cached_records():
+            for record in self._record_index().values():
+                yield record.to_record(self)
+            return
+        for aws_record in self._iter_aws_records():
             record = Record.from_aws_record(aws_record, zone=self)
             if record:
-                entries[record.id] = record
-        return entries
+                yield record
+
+    def records_page(self, start, max_items=MAX_LIST_ITEMS):
+        """
+        Up to max_items of the zone's records, in the order Route53 lists them, starting at the
+        (name, type, set identifier) marker; type and set identifier can be None. Returns the
+        records and the marker of the ones that follow, None after the last record.
+        Pages come from the cached record set when there is one, otherwise from Route53.
+        Zones missing from Route53 have no records, like `iter_records` lists them.
+        """
+        if not self.id:
+            return [], None
+        if self._has_cached_records():
+            name, type_, set_identifier = start
+            start_key = _aws_sort_key({'Name': _escape_dns_name(name), 'Type': type_ or '',
+                                       'SetIdentifier': set_identifier})
+            aws_records = itertools.dropwhile(lambda aws_record: _aws_sort_key(aws_record) < start_key,
+                                              self._aws_records)
+            page = list(itertools.islice(aws_records, max_items + 1))
+            next_start = _aws_record_key(page.pop()) if len(page) > max_items else None
+        else:
+            try:
+                response = self._client.list_resource_record_sets(
+                    HostedZoneId=self.id, MaxItems=str(max_items),
+                    **_start_record_kwargs(*start))
+            except self._client.exceptions.NoSuchHostedZone:
+                self._clear_cache()
+                return [], None
+            page = response['ResourceRecordSets']
+            next_start = None
+            if response.get('IsTruncated'):
+                next_start = (response['NextRecordName'], response.get('NextRecordType'),
+                              response.get('NextRecordIdentifier'))
+        records = [Record.from_aws_record(aws_record, zone=self) for aws_record in page]
+        return [record for record in records if record], next_start
+
+    def records_with_prefix(self, prefix):
+        """
+        The zone's records whose name starts with prefix, eg. the records of a policy tree.
+        Unless the record set is cached, only the range of names starting with the prefix is
+        listed from Route53, instead of the whole zone.
+        """
+        if not self.id:
+            return []
+        if self._has_cached_records():
+            return [record.to_record(self) for record in self._record_index().values()
+                    if record.name.startswith(prefix)]
+        # Route53 lists names with the labels reversed, so the names whose label under the root
+        # starts with the prefix come one after the other, starting at the prefix itself
+        records = []
+        start = ('{}.{}'.format(prefix, self.root), None, None)
+        while start is not None:
+            page, start = self.records_page(start)
+            for record in page:
+                if not record.name.rsplit('.', 1)[-1].startswith(prefix):
+                    return records
+                if record.name.startswith(prefix):
+                    records.append(record)
+        return records
+
+    def _has_cached_records(self):
+        """Whether we hold the zone's record set, taking it from the shared cache if it's there"""
+        if self._aws_records is None and self.id:
+            records, version = record_cache.get(self.id)
+            if records is not None:
+                self._aws_records, self._version, self._exists = records, version, True
+        return self._aws_records is not None
+
+    def get_record(self, record_id):
+        record = self._record_index().get(record_id)
+        return record.to_record(self) if record is not None else None
+
+    def frozen_records(self):
+        """The FrozenRecords of the zone's record set, without building a Record for each"""
+        return list(self._record_index().values())
+
+    def get_frozen_record(self, record_id):
+        """The FrozenRecord of the zone's record set with record_id, None if there's none"""
+        return self._record_index().get(record_id)
+
+    def find_record(self, record):
+        """
+        The FrozenRecord of the zone's record set with the id of record, None if there's none.
+        Unless the record set is cached, only that record is listed from Route53.
+        """
+        if not self.id:
+            return None
+        if self._has_cached_records():
+            return self.get_frozen_record(record.id)
+        start = (record._add_root(record.name, self.root), record.type, record.set_identifier)
+        page, _ = self.records_page(start, max_items=1)
+        for found in page:
+            if found.id == record.id:
+                return FrozenRecord(found)
+        return None
 
     @property
     def exists(self):
-        self._cache_aws_records()
+        """Whether the hosted zone exists, asking Route53 unless the record set is cached"""
+        if self._exists is None and not self._has_cached_records():
+            if not self.id:
+                return False
+            try:
+                self._client.get_hosted_zone(Id=self.id)
+            except self._client.exceptions.NoSuchHostedZone:
+                return False
+            self._exists = True
         return self._exists
 
     @property
     def ns(self):
         if not self.exists:
             return None
-        ns = [record for record in self.records().values()
+        ns = [record for record in self._record_index().values()
               if record.type == 'NS' and record.name == '@']
         assert len(ns) == 1
-        return ns[0]
+        return ns[0].to_record(self)
+
+    def get_delegation_name_servers(self):
+        """
+        The name servers Route53 assigned to the zone, sorted and fully qualified, or None if they
+        can't be told without listing the zone's records.
+        Costs a single get_hosted_zone call.
+        """
+        if not self.id:
+            return None
+        try:
+            hosted_zone = self._client.get_hosted_zone(Id=self.id)
+        except self._client.exceptions.NoSuchHostedZone:
+            return None
+        delegation_set = hosted_zone.get('DelegationSet')
+        if not delegation_set:
+            # private zones have no delegation set
+            return None
+        return sorted([name if name.endswith('.') else name + '.'
+                       for name in delegation_set['NameServers']])
 
     def _cache_aws_records(self):
         if self._aws_records is not None:
             return
-        if not self.id:
-            return
+        for _ in self._iter_aws_records():
+            pass
+
+    def _iter_aws_records(self):
+        """
+        Yield the zone's record sets, from the shared cache or listed from Route53 page by page.
+        Once the whole zone is listed it gets cached like `_cache_aws_records` does.
+        """
+        if self._aws_records is None and self.id:
+            records, version = record_cache.get(self.id)
+            self._version = version
+            if records is None:
+                yield from self._list_aws_records(version)
+                return
+            self._aws_records = records
+            self._exists = True
+        yield from self._aws_records or []
+
+    def _list_aws_records(self, version):
         paginator = self._client.get_paginator('list_resource_record_sets')
         records = []
         try:
             for page in paginator.paginate(HostedZoneId=self.id):
                 records.extend(page['ResourceRecordSets'])
+                yield from page['ResourceRecordSets']
         except self._client.exceptions.NoSuchHostedZone:
             self._clear_cache()
         else:
             self._aws_records = records
             self._exists = True
+            record_cache.set(self.id, records, version)
 
     def _clear_cache(self):
         self._aws_records = None
         self._exists = None
+        if self.id:
+            record_cache.delete(self.id)
 
     def delete_from_r53(self):
         self._delete_records()
         self._client.delete_hosted_zone(Id=self.id)
+        self._clear_cache()
 
     def delete(self):
         if self.exists:
@@ -141,11 +509,15 @@ class Zone(object):
             })
 
         if to_delete:
-            self._client.change_resource_record_sets(
-                HostedZoneId=self.id,
-                ChangeBatch={
-                    'Changes': to_delete
-                })
+            try:
+                for changes in _split_changes(to_delete):
+                    self._client.change_resource_record_sets(
+                        HostedZoneId=self.id,
+                        ChangeBatch={
+                            'Changes': changes
+                        })
+            finally:
+                self._clear_cache()
 
     def create(self):
         if self.db_zone.caller_reference is None:
@@ -180,11 +552,12 @@ class Zone(object):
                 self.create()
 
     def check_policy_trees(self):
-        clean_policy_records = self.db_zone.policy_records.filter(dirty=False)
+        clean_policy_records = self.db_zone.policy_records.filter(dirty=False) \
+                                                          .select_related('policy')
         clean_policies = set([policy_record.policy for policy_record in clean_policy_records])
         assert self._change_batch == []
-        for policy in clean_policies:
-            r53_policy = Policy(policy=policy, zone=self)
+        for r53_policy in Policy.for_policies(self, clean_policies):
+            policy = r53_policy.db_policy
             r53_policy.reconcile()
             if self._change_batch:
                 logger.error("Glitch in the matrix for %s %s", self.root, policy.name)
@@ -193,43 +566,74 @@ class Zone(object):
     def _reconcile_policy_records(self):
         """
         Reconcile policy records for this zone.
+        The changes of all the policy trees, top level aliases and orphaned records are ordered
+        and committed at once. If Route53 rejects them, each policy and policy record gets
+        committed on its own, so a bad one doesn't hold back the others.
         """
         with self.db_zone.lock_dirty_policy_records() as dirty_policy_records:
-            dirty_policies = set()
-            for policy_record in dirty_policy_records:
-                if not policy_record.deleted:
-                    dirty_policies.add(policy_record.policy)
-            for policy in dirty_policies:
-                r53_policy = Policy(policy=policy, zone=self)
-                r53_policy.reconcile()
-                self.commit(preserve_cache=True)
-            for policy_record in dirty_policy_records:
-                try:
-                    with transaction.atomic():
-                        policy_record.r53_policy_record.reconcile()
-                        self.commit(preserve_cache=True)
-                except ClientError:
-                    logger.exception("failed to reconcile record %r", policy_record)
-                    self._reset_change_batch()
-            self._delete_orphaned_managed_records()
+            try:
+                with transaction.atomic():
+                    self._plan_policy_records(dirty_policy_records)
+                    self._change_batch = _order_changes(self._change_batch)
+                    self.commit()
+            except self._client.exceptions.InvalidChangeBatch:
+                logger.warning("committing the policy records of %s one at a time", self.root)
+                self._reset_change_batch()
+                # the plan changed the policy records, start over from the database
+                self._reconcile_policy_records_one_at_a_time(dirty_policy_records.all())
+
+    @staticmethod
+    def _dirty_policies(dirty_policy_records):
+        return set([policy_record.policy for policy_record in dirty_policy_records
+                    if not policy_record.deleted])
+
+    def _plan_policy_records(self, dirty_policy_records):
+        """Queue the changes reconciling the dirty policy records, without committing them"""
+        for r53_policy in Policy.for_policies(self, self._dirty_policies(dirty_policy_records)):
+            r53_policy.reconcile()
+        for policy_record in dirty_policy_records:
+            policy_record.r53_policy_record.reconcile()
+        self._delete_orphaned_managed_records()
+
+    def _reconcile_policy_records_one_at_a_time(self, dirty_policy_records):
+        # part of the batch may have been committed already, so the trees are planned again
+        # from the records we have now, instead of replaying the changes of the batch
+        for r53_policy in Policy.for_policies(self, self._dirty_policies(dirty_policy_records)):
+            r53_policy.reconcile()
             self.commit()
+        for policy_record in dirty_policy_records:
+            try:
+                with transaction.atomic():
+                    policy_record.r53_policy_record.reconcile()
+                    self.commit()
+            except ClientError:
+                logger.exception("failed to reconcile record %r", policy_record)
+                self._reset_change_batch()
+        self._delete_orphaned_managed_records()
+        self.commit()
 
     def _delete_orphaned_managed_records(self):
-        """Delete any managed record not belonging to one of the zone's policies"""
+        """
+        Delete any managed record not belonging to one of the zone's policies. Only the range
+        of managed names is listed, see `records_with_prefix`. Policy trees never have dots in
+        their names, so dotted ones (left by older trees) are deleted too; those outside of that
+        range are only seen when the zone's record set is cached.
+        """
         active_policy_records = self.db_zone.policy_records.select_related('policy') \
                                                            .exclude(deleted=True)
         policies = set([pr.policy for pr in active_policy_records])
-        for record in self.records().values():
-            if record.is_hidden:
-                for policy in policies:
-                    if record.is_member_of(policy):
-                        break
-                else:
-                    record.deleted = True
-                    self.process_records([record])
+        for record in self.records_with_prefix(RECORD_PREFIX):
+            if '.' not in record.name and any(
+                    record.is_member_of(policy) for policy in policies):
+                continue
+            record.deleted = True
+            self.process_records([record])
 
     def reconcile(self):
         self._reconcile_zone()
+        if self.db_zone.deleted:
+            # the zone is gone, its policy records with it
+            return
         self._reconcile_policy_records()
 
     @classmethod
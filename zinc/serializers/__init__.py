@@ -1,3 +1,10 @@
 from zinc.serializers.policy import PolicySerializer, PolicyMemberSerializer
-from zinc.serializers.record import RecordListSerializer, RecordSerializer
+from zinc.serializers.record import (RecordListSerializer, RecordSerializer,
+                                    RecordChangeSerializer)
 from zinc.serializers.zone import ZoneListSerializer, ZoneDetailSerializer
+
+__all__ = [
+    'PolicySerializer', 'PolicyMemberSerializer',
+    'RecordListSerializer', 'RecordSerializer', 'RecordChangeSerializer',
+    'ZoneListSerializer', 'ZoneDetailSerializer',
+]
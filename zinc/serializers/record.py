@@ -40,6 +40,13 @@ def interpret_client_error():
         raise ValidationError(error.message_dict)
 
 
+def full_clean(zone, record):
+    """Validate a record like a batch of one, see `route53.full_clean_records`"""
+    (errors, ) = route53.full_clean_records(zone.r53_zone, [record])
+    if errors:
+        raise ValidationError(errors)
+
+
 class RecordListSerializer(serializers.ListSerializer):
     # This is used for list the records in Zone serializer
     # by using many=True and passing the entier zone as object
@@ -54,6 +61,78 @@ class RecordListSerializer(serializers.ListSerializer):
         raise NotImplementedError('Can not update records this way. Use records/ endpoint.')
 
 
+def validate_new_record(data):
+    """Checks for the records being created, returns the errors found"""
+    errors = {}
+    # for POLICY_ROUTED the values should contain just one value
+    if data['type'] in ['CNAME'] + ZINC_CUSTOM_RECORD_TYPES:
+        if not len(data.get('values', [])) == 1:
+            errors.update({
+                'values': ('Only one value can be '
+                           'specified for {} records.'.format(data['type']))
+            })
+    else:
+        data.setdefault('ttl', settings.ZINC_DEFAULT_TTL)
+        # for normal records values is required.
+        if not data.get('values', False):
+            errors.update({'values': 'This field is required.'})
+    return errors
+
+
+class RecordBatchSerializer(serializers.ListSerializer):
+    """
+    Applies a list of record changes to a zone, validating them together and committing them
+    to Route53 in one change batch.
+    """
+
+    def _build_record(self, zone, change, seen_ids):
+        change = dict(change)
+        action = change.pop('action')
+        record_id = change.pop('id', None)
+        if action == 'create':
+            return route53.record_factory(zone=zone, created=True, **change)
+        if record_id in seen_ids:
+            raise ValidationError({'id': ['The record is already changed by this batch.']})
+        seen_ids.add(record_id)
+        record = zone.get_record(record_id)
+        if record is None:
+            raise ValidationError({'id': ['Record not found.']})
+        if record.managed:
+            raise ValidationError("Can't change a managed record.")
+        if action == 'delete':
+            record.deleted = True
+        else:
+            for attr, value in change.items():
+                setattr(record, attr, value)
+        return record
+
+    def create(self, validated_data):
+        zone = self.context['zone']
+        records = []
+        errors = []
+        seen_ids = set()
+        for change in validated_data:
+            try:
+                records.append(self._build_record(zone, change, seen_ids))
+                errors.append({})
+            except ValidationError as error:
+                records.append(None)
+                errors.append(error.detail)
+        if not any(errors):
+            errors = route53.full_clean_records(zone.r53_zone, records)
+        if any(errors):
+            raise ValidationError(errors)
+
+        with interpret_client_error():
+            for record in records:
+                record.save()
+            zone.r53_zone.commit()
+        return records
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError('Record batches can only be created.')
+
+
 class RecordSerializer(serializers.Serializer):
     name = fields.CharField(max_length=255)
     fqdn = fields.SerializerMethodField(required=False)
@@ -98,8 +177,8 @@ class RecordSerializer(serializers.Serializer):
     def create(self, validated_data):
         zone = self.context['zone']
         obj = route53.record_factory(zone=zone, created=True, **validated_data)
+        full_clean(zone, obj)
         with interpret_client_error():
-            obj.full_clean()
             obj.save()
             zone.r53_zone.commit()
         return obj
@@ -110,7 +189,7 @@ class RecordSerializer(serializers.Serializer):
             raise ValidationError("Can't change a managed record.")
         for attr, value in validated_data.items():
             setattr(obj, attr, value)
-        obj.full_clean()
+        full_clean(zone, obj)
         obj.save()
         with interpret_client_error():
             zone.commit()
@@ -143,20 +222,42 @@ class RecordSerializer(serializers.Serializer):
                 errors.update({'non_field_errors': ["Can't update 'name' and 'type' fields. "]})
         else:
             # POST method
-            # for POLICY_ROUTED the values should contain just one value
-            if data['type'] in ['CNAME'] + ZINC_CUSTOM_RECORD_TYPES:
-                if not len(data['values']) == 1:
-                    errors.update({
-                        'values': ('Only one value can be '
-                                   'specified for {} records.'.format(data['type']))
-                    })
-            else:
-                data.setdefault('ttl', settings.ZINC_DEFAULT_TTL)
-                # for normal records values is required.
-                if not data.get('values', False):
-                    errors.update({'values': 'This field is required.'})
+            errors.update(validate_new_record(data))
 
         if errors:
             raise ValidationError(errors)
 
         return data
+
+
+class RecordChangeSerializer(RecordSerializer):
+    """A record create, update or delete sent to the records:batch endpoint"""
+    ACTIONS = ('create', 'update', 'delete')
+
+    action = fields.ChoiceField(choices=ACTIONS)
+    id = fields.CharField(required=False)
+    name = fields.CharField(max_length=255, required=False)
+    type = fields.ChoiceField(choices=ZINC_RECORD_TYPES, required=False)
+    values = fields.ListField(child=fields.CharField(), required=False)
+
+    class Meta:
+        list_serializer_class = RecordBatchSerializer
+
+    def validate(self, data):
+        errors = {}
+        if data['action'] == 'create':
+            for field in ('name', 'type'):
+                if field not in data:
+                    errors[field] = ['This field is required.']
+            if 'id' in data:
+                errors['id'] = ["Can't set the id of a new record."]
+            if not errors:
+                errors.update(validate_new_record(data))
+        else:
+            if 'id' not in data:
+                errors['id'] = ['This field is required.']
+            if 'type' in data or 'name' in data:
+                errors['non_field_errors'] = ["Can't update 'name' and 'type' fields. "]
+        if errors:
+            raise ValidationError(errors)
+        return data
@@ -7,6 +7,7 @@ from celery.utils.log import get_task_logger
 from django.conf import settings
 
 from zinc import models, route53
+from zinc.route53 import rate_limit
 
 logger = get_task_logger(__name__)
 
@@ -18,7 +19,8 @@ def aws_delete_zone(self, pk):
     aws_zone = zone.r53_zone
 
     try:
-        aws_zone.delete()
+        with rate_limit.priority(rate_limit.RECONCILE):
+            aws_zone.delete()
     except Exception as e:
         logger.exception(e)
         try:
@@ -27,12 +29,29 @@ def aws_delete_zone(self, pk):
             logger.error('Failed to remove zone %s', zone.id)
 
 
+def _redis_client():
+    return redis.from_url(settings.LOCK_SERVER_URL)
+
+
+def _queued_key(zone_id):
+    return 'reconcile_zone_queued:{}'.format(zone_id)
+
+
+def _queue_zone(redis_client, zone_id):
+    # don't queue a zone again while it's waiting for a worker; the marker expires in
+    # case the task gets lost
+    if redis_client.set(_queued_key(zone_id), 1, nx=True, ex=300):
+        reconcile_zone.delay(zone_id)
+
+
 @shared_task(bind=True, ignore_result=True)
 def reconcile_zones(bind=True):
     """
-    Periodic task that reconciles everything zone-related (zone deletion, policy record updates)
+    Periodic task that fans out one reconcile_zone task for every zone due in the dirty zone
+    queue (zone deletion, policy record updates), so zones get reconciled in parallel by the
+    workers.
     """
-    redis_client = redis.from_url(settings.LOCK_SERVER_URL)
+    redis_client = _redis_client()
     lock = redis_lock.Lock(redis_client, 'recouncile_zones', expire=60)
 
     if not lock.acquire(blocking=False):
@@ -40,43 +59,100 @@ def reconcile_zones(bind=True):
         return
 
     try:
-        for zone in models.Zone.need_reconciliation():
-            try:
+        for zone_id in models.DirtyZone.due().values_list('zone_id', flat=True):
+            _queue_zone(redis_client, zone_id)
+    finally:
+        lock.release()
+
+
+@shared_task(bind=True, ignore_result=True)
+def propagate_policy(self, policy_id):
+    """
+    Fans out one reconcile_zone task for every zone of a changed policy, instead of waiting
+    for the periodic reconcile_zones. Zones already waiting for a worker are skipped.
+    """
+    redis_client = _redis_client()
+    zone_ids = models.DirtyZone.due().filter(zone__policy_records__policy_id=policy_id) \
+                                     .values_list('zone_id', flat=True).distinct()
+    for zone_id in zone_ids:
+        _queue_zone(redis_client, zone_id)
+
+
+@shared_task(bind=True, ignore_result=True)
+def enqueue_dirty_zones(bind=True):
+    """
+    Safety net for the dirty zone queue, queues the zones needing reconciliation that were
+    changed without going through it.
+    """
+    zone_ids = models.Zone.need_reconciliation().values_list('pk', flat=True)
+    models.DirtyZone.push(zone_ids, requeue=False)
+
+
+@shared_task(bind=True, ignore_result=True,
+             rate_limit=getattr(settings, 'ZINC_RECONCILE_RATE_LIMIT', None))
+def reconcile_zone(self, zone_id):
+    redis_client = _redis_client()
+    lock = redis_lock.Lock(redis_client, 'reconcile_zone:{}'.format(zone_id),
+                           expire=60, auto_renewal=True)
+    if not lock.acquire(blocking=False):
+        logger.info('Zone %s is being reconciled by another task. Bailing out.', zone_id)
+        # the zone stays in the dirty zone queue, let the next fan out queue it again
+        redis_client.delete(_queued_key(zone_id))
+        return
+
+    try:
+        redis_client.delete(_queued_key(zone_id))
+        zone = models.Zone.objects.filter(pk=zone_id).first()
+        if zone is None:
+            return
+        entry = models.DirtyZone.objects.filter(zone_id=zone_id).first()
+        try:
+            with rate_limit.priority(rate_limit.RECONCILE):
                 zone.reconcile()
-                lock.extend(5)  # extend the lease each time we rebuild a tree
-            except Exception:
-                logger.exception(
-                    "reconcile failed for Zone %s.%s", zone, zone.root
-                )
+        except Exception as e:
+            logger.exception(
+                "reconcile failed for Zone %s.%s", zone, zone.root
+            )
+            if entry is not None:
+                entry.failed(repr(e))
+        else:
+            if entry is not None:
+                entry.complete(zone)
     finally:
         lock.release()
 
 
 @shared_task(bind=True, ignore_result=True)
 def check_clean_zones(bind=True):
-    for zone in models.Zone.get_clean_zones():
-        zone.r53_zone.check_policy_trees()
+    with rate_limit.priority(rate_limit.BACKGROUND):
+        for zone in models.Zone.get_clean_zones():
+            zone.r53_zone.check_policy_trees()
 
 
 @shared_task(bind=True, ignore_result=True)
-def reconcile_healthchecks(bind=True):
-    route53.HealthCheck.reconcile_for_ips(models.IP.objects.all())
+def reconcile_healthchecks(bind=True, ips=None):
+    """Reconcile the health checks of all the IPs, or only of the given IP addresses"""
+    queryset = models.IP.objects.all()
+    if ips is not None:
+        queryset = queryset.filter(pk__in=ips)
+    with rate_limit.priority(rate_limit.BACKGROUND):
+        route53.HealthCheck.reconcile_for_ips(queryset, full=ips is None)
 
 
 @shared_task(bind=True, ignore_result=True)
 def update_ns_propagated(bind=True):
-    redis_client = redis.from_url(settings.LOCK_SERVER_URL)
+    redis_client = _redis_client()
 
-    # make this lock timeout big enough to cover updating about 1000 zones
-    # ns_propagated flag and small enough to update the flag in an acceptable
-    # time frame. 5 minutes sound good at the moment.
+    # make this lock timeout big enough to cover resolving the name servers of all zones
+    # and small enough to update the flag in an acceptable time frame.
     lock = redis_lock.Lock(redis_client, 'update_ns_propagated', expire=300)
 
     if not lock.acquire(blocking=False):
         logger.info('Cannot aquire task lock. Probaly another task is running. Bailing out.')
         return
     try:
-        models.Zone.update_ns_propagated(delay=getattr(settings, 'ZINC_NS_UPDATE_DELAY', 0.3))
+        with rate_limit.priority(rate_limit.BACKGROUND):
+            models.Zone.update_ns_propagated()
     except Exception:
         logger.exception("Could not update ns_propagated flag")
     finally:
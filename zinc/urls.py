@@ -9,6 +9,8 @@ router.register('policies', views.PolicyViewset, 'policy')
 router.register('zones', views.ZoneViewset, 'zone')
 
 urlpatterns = router.urls + [
+    path('zones/<int:zone_id>/records:batch',
+        views.RecordBatch.as_view(), name='record-batch'),
     path('zones/<int:zone_id>/records/<str:record_id>',
         views.RecordDetail.as_view(), name='record-detail'),
     path('zones/<int:zone_id>/records',
@@ -1,12 +1,20 @@
-from rest_framework.generics import (ListAPIView, CreateAPIView, RetrieveUpdateDestroyAPIView)
+import itertools
+
+from django.db import transaction
+from rest_framework.generics import (ListAPIView, CreateAPIView, GenericAPIView,
+                                     RetrieveUpdateDestroyAPIView)
 from rest_framework import viewsets, status, mixins, views
+from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.generics import get_object_or_404
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 
 from zinc.serializers import (PolicySerializer, ZoneDetailSerializer,
-                              ZoneListSerializer, RecordSerializer)
+                              ZoneListSerializer, RecordSerializer, RecordChangeSerializer)
 from zinc import models
+from zinc.pagination import RecordCursorPagination
+from zinc.renderers import StreamingJSONResponse
 from zinc.utils import memoized_property
 
 
@@ -14,6 +22,10 @@ class PolicyViewset(viewsets.ReadOnlyModelViewSet):
     serializer_class = PolicySerializer
     queryset = models.Policy.objects.all()
 
+    @action(detail=True)
+    def propagation(self, request, pk=None):
+        return Response(self.get_object().propagation())
+
 
 class ZoneViewset(mixins.CreateModelMixin,
                   mixins.RetrieveModelMixin,
@@ -22,6 +34,12 @@ class ZoneViewset(mixins.CreateModelMixin,
                   viewsets.GenericViewSet):
     queryset = models.Zone.objects.filter(deleted=False)
 
+    def get_queryset(self):
+        queryset = models.Zone.with_dirty_flag(super().get_queryset())
+        if self.action != 'list':
+            queryset = queryset.prefetch_related('policy_records__policy')
+        return queryset
+
     def get_serializer_class(self):
         if self.action in ['list', 'create']:
             return ZoneListSerializer
@@ -43,10 +61,10 @@ class RecordDetail(RetrieveUpdateDestroyAPIView):
         zone = self.zone
         record_id = self.kwargs['record_id']
 
-        for record in zone.records:
-            if record.id == record_id:
-                return record
-        raise NotFound(detail='Record not found.')
+        record = zone.get_record(record_id)
+        if record is None:
+            raise NotFound(detail='Record not found.')
+        return record
 
     @memoized_property
     def zone(self):
@@ -70,11 +88,39 @@ class RecordDetail(RetrieveUpdateDestroyAPIView):
 class RecordCreate(ListAPIView, CreateAPIView):
     serializer_class = RecordSerializer
     paginator = None
+    filter_query_params = ('name', 'type')
 
     def list(self, request, zone_id):
         zone = get_object_or_404(models.Zone, id=zone_id)
-        zone_data = ZoneDetailSerializer(zone, context={'request': request}).data
-        return Response(zone_data['records'])
+        filters = {param: request.query_params[param] for param in self.filter_query_params
+                   if request.query_params.get(param)}
+        serializer = RecordSerializer(context={'request': request, 'zone': zone})
+        fields = request.query_params.get('fields')
+        if fields:
+            # only compute the fields asked for, eg. ?fields=name,type,values skips the ids
+            fields = set(fields.split(','))
+            unknown = fields - set(serializer.fields)
+            if unknown:
+                raise ValidationError({'fields': ['Unknown fields: {}.'.format(
+                    ', '.join(sorted(unknown)))]})
+            for name in set(serializer.fields) - fields:
+                serializer.fields.pop(name)
+
+        # pages are only used when asked for, otherwise all the records are streamed
+        pagination = RecordCursorPagination()
+        if pagination.is_requested(request):
+            records = pagination.paginate_records(zone, request, **filters)
+            return pagination.get_paginated_response(
+                [serializer.to_representation(record) for record in records])
+        records = zone.iter_records(**filters)
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            # the browsable API renders the whole response at once anyway
+            return Response([serializer.to_representation(record) for record in records])
+        # read the first record, so the first page of the zone, before sending the status: errors
+        # listing the zone (eg. throttling) get their error response instead of breaking the stream
+        first = list(itertools.islice(records, 1))
+        return StreamingJSONResponse(serializer.to_representation(record)
+                                     for record in itertools.chain(first, records))
 
     def get_queryset(self):
         return None
@@ -91,6 +137,30 @@ class RecordCreate(ListAPIView, CreateAPIView):
         return context
 
 
+class RecordBatch(GenericAPIView):
+    """Create, update and delete many records of a zone with a single Route53 change batch"""
+    queryset = models.Zone.objects.filter(deleted=False)
+    serializer_class = RecordChangeSerializer
+
+    @memoized_property
+    def zone(self):
+        return get_object_or_404(self.get_queryset(), id=self.kwargs['zone_id'])
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['zone'] = self.zone
+        return context
+
+    @transaction.atomic
+    def post(self, request, zone_id):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        records = serializer.save()
+        context = self.get_serializer_context()
+        return Response([RecordSerializer(record, context=context).data
+                         for record in records if not record.deleted])
+
+
 class HealtchCheck(views.APIView):
     permission_classes = ()
 